@@ -14,6 +14,38 @@ register(
     id='BackgammonRandomEnv-v0',
     entry_point='amca.envs:BackgammonRandomEnv',
 )
+register(
+    id='BackgammonHumanMaskedEnv-v0',
+    entry_point='amca.envs:BackgammonHumanMaskedEnv',
+)
+register(
+    id='BackgammonRandomMaskedEnv-v0',
+    entry_point='amca.envs:BackgammonRandomMaskedEnv',
+)
+register(
+    id='BackgammonRandomCompactEnv-v0',
+    entry_point='amca.envs:BackgammonRandomCompactEnv',
+)
+register(
+    id='BackgammonRandomMaskedCompactEnv-v0',
+    entry_point='amca.envs:BackgammonRandomMaskedCompactEnv',
+)
+register(
+    id='BackgammonHumanTDEnv-v0',
+    entry_point='amca.envs:BackgammonHumanTDEnv',
+)
+register(
+    id='BackgammonRandomTDEnv-v0',
+    entry_point='amca.envs:BackgammonRandomTDEnv',
+)
+register(
+    id='BackgammonHumanMaskedTDEnv-v0',
+    entry_point='amca.envs:BackgammonHumanMaskedTDEnv',
+)
+register(
+    id='BackgammonRandomMaskedTDEnv-v0',
+    entry_point='amca.envs:BackgammonRandomMaskedTDEnv',
+)
 register(
     id='BackgammonRandomContinuousEnv-v0',
     entry_point='amca.envs:BackgammonRandomContinuousEnv',
@@ -12,21 +12,23 @@
     The Human agent takes an action according to a human decision.
 """
 
+from amca.game.game import ALL_ACTIONS, ACTION_INDEX
+
 
 class HumanAgent:
     def __init__(self):
         self.__actions = self.all_possible_actions()
 
-    def make_decision(self, observation):
-        """Returns the action that is closest to the predicted output."""
+    def make_decision(self, observation, mask=None):
+        """Returns the action that is closest to the predicted output. If a
+        mask of the valid actions is given, they are listed."""
 
         self.print_observation(observation)
-        # print('Available actions:')
-        # acts = self.get_valid_actions(observation)
-        # actints = [self.__actions.index(x) for x in acts]
-        # for actint, act in actints, acts:
-        #     print('{} - {}'.format(actint, act))
-
+        if mask is not None:
+            print('Available actions:')
+            for actionint, valid in enumerate(mask):
+                if valid:
+                    print('{} - {}'.format(actionint, self.__actions[actionint]))
         # actint = int(input('Type action ID'))
         # while actint not in actints:
         #     print('Invalid action ID chosen')
@@ -47,32 +49,12 @@ class HumanAgent:
             source = int(input('input source {0,1,..,23}'))
             action = (action_type, source)
 
-        actionint = self.__actions.index(action)
+        actionint = ACTION_INDEX[action]
 
         return actionint
 
     def all_possible_actions(self):
-        actions = []
-        sources = list(range(0, 24))
-        targets = list(range(0, 24))
-        homes = list(range(0, 6)) + list(range(18, 24))
-
-        # 'move's and 'hit's
-        for i in sources:
-            for j in targets:
-                if (j - i) <= 6:
-                    actions.append(('move', i, j))
-                    actions.append(('move', j, i))
-                    actions.append(('hit', i, j))
-                    actions.append(('hit', j, i))
-
-        # 'reenter's, 'reenter_hit's and 'bearoff's
-        for j in homes:
-            actions.append(('reenter', j))
-            actions.append(('reenter_hit', j))
-            actions.append(('bearoff', j))
-
-        return actions
+        return list(ALL_ACTIONS)
 
     # def get_valid_actions(self, observation):
     #     """Returns all the possible actions. Assumes the player is b player."""
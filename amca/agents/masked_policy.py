@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    The masked MLP policy is an actor-critic policy for the masked Backgammon
+    environments, which append the mask of the valid actions to the
+    observation. The policy only sees the rest of the observation, and gives
+    the invalid actions a probability of zero, so that they are never sampled
+    nor chosen as the most probable action.
+
+    The masked DQN policy does the same for the Q-values of DQN, and MaskedDQN
+    explores only among the valid actions when it takes a random action.
+"""
+
+import numpy as np
+import tensorflow as tf
+from stable_baselines import DQN
+from stable_baselines.a2c.utils import linear
+from stable_baselines.common.policies import ActorCriticPolicy, mlp_extractor
+from stable_baselines.deepq.policies import DQNPolicy
+
+# Offset of the Q-values and logits of the invalid actions. It is finite, as
+# the Q-values of all the actions are multiplied by zero in the loss of DQN.
+INVALID_OFFSET = -1e9
+
+
+class MaskedMlpPolicy(ActorCriticPolicy):
+    def __init__(self, sess, ob_space, ac_space, n_env, n_steps, n_batch,
+                 reuse=False, net_arch=None, act_fun=tf.tanh, **kwargs):
+        super().__init__(sess, ob_space, ac_space, n_env, n_steps, n_batch,
+                         reuse=reuse, scale=False)
+
+        if net_arch is None:
+            net_arch = [dict(vf=[64, 64], pi=[64, 64])]
+        n_actions = ac_space.n
+
+        with tf.variable_scope('model', reuse=reuse):
+            observation = tf.layers.flatten(self.processed_obs)
+            features = observation[:, :-n_actions]
+            mask = observation[:, -n_actions:]
+
+            pi_latent, vf_latent = mlp_extractor(features, net_arch, act_fun)
+            self._value_fn = linear(vf_latent, 'vf', 1)
+
+            # Invalid actions get logits low enough to have no probability.
+            logits = linear(pi_latent, 'pi', n_actions, init_scale=0.01)
+            logits = logits + (1.0 - mask) * INVALID_OFFSET
+            self._proba_distribution = self.pdtype.proba_distribution_from_flat(
+                logits)
+            self._policy = logits
+            self.q_value = linear(vf_latent, 'q', n_actions, init_scale=0.01)
+
+        self._setup_init()
+
+    def step(self, obs, state=None, mask=None, deterministic=False):
+        if deterministic:
+            action = self.deterministic_action
+        else:
+            action = self.action
+        action, value, neglogp = self.sess.run(
+            [action, self.value_flat, self.neglogp], {self.obs_ph: obs})
+
+        return action, value, self.initial_state, neglogp
+
+    def proba_step(self, obs, state=None, mask=None):
+        return self.sess.run(self.policy_proba, {self.obs_ph: obs})
+
+    def value(self, obs, state=None, mask=None):
+        return self.sess.run(self.value_flat, {self.obs_ph: obs})
+
+
+class MaskedDQNPolicy(DQNPolicy):
+    def __init__(self, sess, ob_space, ac_space, n_env, n_steps, n_batch,
+                 reuse=False, layers=None, dueling=True, act_fun=tf.nn.relu,
+                 obs_phs=None, **kwargs):
+        super().__init__(sess, ob_space, ac_space, n_env, n_steps, n_batch,
+                         dueling=dueling, reuse=reuse, scale=False,
+                         obs_phs=obs_phs)
+
+        if layers is None:
+            layers = [64, 64]
+        n_actions = ac_space.n
+
+        with tf.variable_scope('model', reuse=reuse):
+            observation = tf.layers.flatten(self.processed_obs)
+            features = observation[:, :-n_actions]
+            mask = observation[:, -n_actions:]
+
+            with tf.variable_scope('action_value'):
+                action_out = features
+                for i, layer_size in enumerate(layers):
+                    action_out = act_fun(linear(action_out, 'fc{}'.format(i),
+                                                layer_size))
+                q_out = linear(action_out, 'q', n_actions)
+            if self.dueling:
+                with tf.variable_scope('state_value'):
+                    state_out = features
+                    for i, layer_size in enumerate(layers):
+                        state_out = act_fun(linear(state_out, 'fc{}'.format(i),
+                                                   layer_size))
+                    state_score = linear(state_out, 'v', 1)
+                q_out = state_score + q_out - tf.reduce_mean(q_out, axis=1,
+                                                             keepdims=True)
+
+            # Invalid actions are never the argmax of the Q-values, neither
+            # when acting nor in the targets of the next states.
+            self.q_values = q_out + (1.0 - mask) * INVALID_OFFSET
+
+        self._setup_init()
+
+    def step(self, obs, state=None, mask=None, deterministic=True):
+        q_values, actions_proba = self.sess.run(
+            [self.q_values, self.policy_proba], {self.obs_ph: obs})
+        if deterministic:
+            actions = np.argmax(q_values, axis=1)
+        else:
+            actions = np.array([np.random.choice(self.n_actions, p=proba)
+                                for proba in actions_proba])
+
+        return actions, q_values, None
+
+    def proba_step(self, obs, state=None, mask=None):
+        return self.sess.run(self.policy_proba, {self.obs_ph: obs})
+
+
+class MaskedDQN(DQN):
+    """
+    DQN for the masked environments, whose epsilon-greedy exploration takes a
+    random action among the valid ones, read from the mask at the end of the
+    observation, instead of among all the actions.
+    """
+
+    def setup_model(self):
+        super().setup_model()
+        greedy_act = self.act
+        self.__epsilon = 0.0
+
+        def act(obs, stochastic=True, update_eps=-1, **kwargs):
+            actions = greedy_act(obs, stochastic=False, update_eps=update_eps,
+                                 **kwargs)
+            if update_eps >= 0:
+                self.__epsilon = update_eps
+            if not stochastic:
+                return actions
+            masks = np.asarray(obs)[:, -self.action_space.n:] > 0
+            for i in np.flatnonzero(np.random.rand(len(actions)) < self.__epsilon):
+                valid = np.flatnonzero(masks[i])
+                if valid.size:
+                    actions[i] = np.random.choice(valid)
+                else:
+                    actions[i] = np.random.randint(self.action_space.n)
+
+            return actions
+
+        self.act = act
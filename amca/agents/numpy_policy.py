@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    The NumPy policy evaluates the actor of a trained MLP policy with plain
+    NumPy matrix products, from weights exported once from its stable_baselines
+    model into a .npz file. It needs neither TensorFlow nor a session, and has
+    the predict and action_probability methods of the stable_baselines models,
+    so that it can be used in their place.
+"""
+
+import re
+
+from gym import spaces
+import numpy as np
+
+
+# Names of the actor layers of the stable_baselines MLP policies, e.g.
+# 'model/pi_fc0/w:0'. TRPO keeps a copy of them under 'oldpi/'.
+LAYER_NAME = re.compile(r'(?:^|/)model/(shared_fc\d+|pi_fc\d+|pi)/([wb]):0$')
+
+ACTIVATIONS = {'tanh': np.tanh,
+               'relu': lambda x: np.maximum(x, 0)}
+
+
+def export_policy(model, path):
+    """Saves the actor weights of a stable_baselines model trained with an MLP
+    policy over discrete actions into a .npz file."""
+
+    if not isinstance(model.action_space, spaces.Discrete):
+        raise ValueError('Only policies over discrete actions can be exported')
+
+    layers = {}
+    for name, value in model.get_parameters().items():
+        match = LAYER_NAME.search(name)
+        if match is None or name.startswith('oldpi/'):
+            continue
+        layers.setdefault(match.group(1), {})[match.group(2)] = value
+    if 'pi' not in layers:
+        raise ValueError('Only MLP actor-critic policies can be exported')
+
+    def order(layer):
+        if layer == 'pi':
+            return (2, 0)
+        kind, index = layer.rsplit('_fc', 1)
+        return (0 if kind == 'shared' else 1, int(index))
+
+    activation = model.policy_kwargs.get('act_fun', None)
+    activation = 'tanh' if activation is None else activation.__name__
+    if activation not in ACTIVATIONS:
+        raise ValueError('Unsupported activation: {}'.format(activation))
+
+    arrays = {}
+    for index, layer in enumerate(sorted(layers, key=order)):
+        arrays['w{}'.format(index)] = np.asarray(layers[layer]['w'], dtype=np.float32)
+        arrays['b{}'.format(index)] = np.asarray(layers[layer]['b'], dtype=np.float32)
+
+    # Masked policies only see the observation without its appended mask.
+    # Models keep the class of their policy, whose module imports TensorFlow.
+    from amca.agents.masked_policy import MaskedMlpPolicy
+    masked = issubclass(model.policy, MaskedMlpPolicy)
+
+    np.savez(path, num_layers=len(layers), activation=activation, masked=masked,
+             observation_size=model.observation_space.shape[0], **arrays)
+
+
+class NumpyPolicy:
+    """
+    Actor of an exported MLP policy.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            num_layers = int(data['num_layers'])
+            self.__weights = [data['w{}'.format(i)] for i in range(num_layers)]
+            self.__biases = [data['b{}'.format(i)] for i in range(num_layers)]
+            self.__activation = ACTIVATIONS[str(data['activation'])]
+            self.__masked = bool(data['masked'])
+            observation_size = int(data['observation_size'])
+
+        num_actions = self.__biases[-1].size
+        self.observation_space = spaces.Box(low=-np.inf, high=np.inf,
+                                            shape=(observation_size,),
+                                            dtype=np.float32)
+        self.action_space = spaces.Discrete(num_actions)
+
+    def get_logits(self, observations):
+        """Returns the (N, number of actions) logits of a batch of
+        observations."""
+
+        observations = np.asarray(observations, dtype=np.float32)
+        mask = None
+        if self.__masked:
+            mask = observations[:, -self.action_space.n:]
+            observations = observations[:, :-self.action_space.n]
+
+        hidden = observations
+        for weight, bias in zip(self.__weights[:-1], self.__biases[:-1]):
+            hidden = self.__activation(hidden @ weight + bias)
+        logits = hidden @ self.__weights[-1] + self.__biases[-1]
+        if mask is not None:
+            logits += (1.0 - mask) * -1e9
+
+        return logits
+
+    def action_probability(self, observation):
+        """Returns the probabilities of the actions of an observation, or of a
+        batch of observations."""
+
+        observations = np.asarray(observation, dtype=np.float32)
+        single = observations.ndim == 1
+        logits = self.get_logits(observations.reshape(-1, observations.shape[-1]))
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+
+        return probabilities[0] if single else probabilities
+
+    def predict(self, observation, state=None, mask=None, deterministic=False):
+        """Returns the actions of an observation, or of a batch of
+        observations, and None as the state, like stable_baselines."""
+
+        probabilities = self.action_probability(observation)
+        single = probabilities.ndim == 1
+        probabilities = probabilities.reshape(-1, self.action_space.n)
+        if deterministic:
+            actions = probabilities.argmax(axis=1)
+        else:
+            # Samples every row at once by inverting its cumulative sum.
+            cumulative = probabilities.cumsum(axis=1)
+            draws = np.random.random_sample((len(cumulative), 1)) * cumulative[:, -1:]
+            actions = (cumulative < draws).sum(axis=1)
+            actions = np.minimum(actions, self.action_space.n - 1)
+
+        return (actions[0] if single else actions), None
@@ -12,37 +12,75 @@
     The Policy agent takes an action according to a DNN.
 """
 
-from stable_baselines import A2C, ACER, ACKTR, DDPG, DQN, GAIL, PPO2, TRPO, SAC
+import numpy as np
 
+from amca.agents.registry import ALGORITHMS, get_model
 
-class PolicyAgent:
-    def __init__(self, algorithm, model):
-        if algorithm.lower() == 'a2c':
-            algorithm = A2C
-        elif algorithm.lower() == 'acer':
-            algorithm = ACER
-        elif algorithm.lower() == 'acktr':
-            algorithm = ACKTR
-        elif algorithm.lower() == 'ddpg':
-            algorithm = DDPG
-        elif algorithm.lower() == 'dqn':
-            algorithm = DQN
-        elif algorithm.lower() == 'gail':
-            algorithm = GAIL
-        elif algorithm.lower() == 'ppo':
-            algorithm = PPO2
-        elif algorithm.lower() == 'sac':
-            algorithm = SAC
-        elif algorithm.lower() == 'trpo':
-            algorithm = TRPO
+
+def get_decisions(policy, observations, masks, deterministic=False):
+    """Returns the actions of a policy for a batch of observations, with one
+    prediction for the whole batch. Each action is sampled, or taken as the
+    most probable one if deterministic, among the valid actions of its mask."""
+
+    # Models trained on masked environments expect the mask appended to the
+    # observation.
+    observations = np.asarray(observations, dtype=np.float32)
+    masks = np.asarray(masks, dtype=bool)
+    if policy.observation_space.shape[0] == observations.shape[1] + masks.shape[1]:
+        observations = np.concatenate([observations, masks], axis=1)
+
+    # Policies over continuous actions have no probabilities to mask.
+    probabilities = policy.action_probability(observations)
+    if probabilities is None or probabilities.shape[-1] != masks.shape[1]:
+        actions, _ = policy.predict(observations, deterministic=deterministic)
+        return list(actions)
+
+    probabilities = np.where(masks, probabilities, 0.0)
+    actions = []
+    for probability, mask in zip(probabilities, masks):
+        total = probability.sum()
+        if total <= 0:
+            actions.append(int(np.random.choice(np.flatnonzero(mask))))
+        elif deterministic:
+            actions.append(int(np.argmax(probability)))
         else:
+            actions.append(int(np.random.choice(mask.size, p=probability/total)))
+
+    return actions
+
+
+class PolicyAgent:
+    # Shown the mirrored board as an opponent, see Game.play_opponent.
+    canonical = True
+
+    def __init__(self, algorithm, model, deterministic=False):
+        if algorithm.lower() not in ALGORITHMS:
             raise ValueError('Unidentified algorithm chosen')
 
-        self.__policy = algorithm.load(model)
+        self.__algorithm = algorithm
+        self.__model = model
+        self.__policy = None
+        self.__deterministic = deterministic
+
+    def get_policy(self):
+        """Returns the model of the agent from the model registry, loading it
+        on first use. Agents of the same model share it."""
+
+        if self.__policy is None:
+            self.__policy = get_model(self.__algorithm, self.__model)
+
+        return self.__policy
 
-    def make_decision(self, observation):
-        """Returns the action according to the policy and observation."""
+    def make_decision(self, observation, mask=None):
+        """Returns the action according to the policy and observation. If a
+        mask of the valid actions is given, the action is sampled, or taken as
+        the most probable one if deterministic, among the valid actions only."""
 
-        action, _ = self.__policy.predict(observation)
+        policy = self.get_policy()
+        if mask is None or not np.any(mask):
+            action, _ = policy.predict(observation,
+                                       deterministic=self.__deterministic)
+            return action
 
-        return action
+        return get_decisions(policy, [observation], [mask],
+                             self.__deterministic)[0]
@@ -0,0 +1,570 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    The Q-table of the SARSA agent. Every (state, action) pair is reduced to a
+    64-bit key, the 64-bit digest of the state xored with a salt of the
+    action, and the keys and float32 values are kept in two NumPy arrays of an
+    open-addressing hash table with linear probing, along with the
+    number of times each entry was updated and when it was last updated. A
+    slot takes 20 bytes and the table is kept at most 70% full, so an entry
+    takes 29 to 57 bytes, instead of the hundreds of bytes of a dict entry
+    keyed by a tuple of a state string and an action tuple.
+
+    A table can be given a memory budget. Once it is full, it evicts a batch
+    of its least visited entries, the least recently updated first among
+    those visited as often, instead of growing.
+
+    Tables are saved in a versioned binary file: a 64-byte header followed by
+    the key, value and visit arrays of the slots as they are in memory. A
+    saved table can be opened with mmap, in which case only the pages of the
+    slots probed are ever read from the disk. Files before version 4 are keyed
+    by other state keys and can not be read.
+"""
+
+import hashlib
+import random
+import struct
+
+import numpy as np
+
+from amca.game import ALL_ACTIONS, ACTION_INDEX
+
+
+# The action of a player that can not move.
+NOMOVE_INDEX = len(ALL_ACTIONS)
+
+# Key of the empty slots. A pair reduced to it is stored as 1 instead.
+EMPTY = 0
+
+MAX_LOAD = 0.7
+
+MASK64 = (1 << 64) - 1
+
+MAX_VISITS = np.iinfo(np.uint32).max
+MAX_TICK = np.iinfo(np.uint32).max
+
+# Bytes of a slot: its key, value, visits and tick.
+SLOT_BYTES = 20
+
+# Share of the entries of a full table evicted at once.
+EVICTION_FRACTION = 0.25
+
+# Header of the table files: the magic, the version, the number of slots, the
+# number of entries and the epsilon, alpha and gamma of the agent, padded to
+# 64 bytes so that the arrays after it are aligned.
+MAGIC = b'AMCAQTBL'
+VERSION = 4
+HEADER = struct.Struct('<8sI4xQQddd')
+HEADER_SIZE = 64
+
+
+def mix(value):
+    """Returns the splitmix64 finalizer of a 64-bit integer, which spreads its
+    bits over the whole key."""
+
+    value ^= value >> 30
+    value = (value * 0xbf58476d1ce4e5b9) & MASK64
+    value ^= value >> 27
+    value = (value * 0x94d049bb133111eb) & MASK64
+    value ^= value >> 31
+
+    return value
+
+
+# Random 64-bit salts of the action indices, xored with the digests of the
+# states to make the keys.
+ACTION_SALTS = [mix((index + 1) * 0x9e3779b97f4a7c15 & MASK64)
+                for index in range(NOMOVE_INDEX + 1)]
+ACTION_SALT = {action: ACTION_SALTS[index] for action, index in ACTION_INDEX.items()}
+ACTION_SALT[('Nomove', 0, 0)] = ACTION_SALTS[NOMOVE_INDEX]
+
+# Random odd 256-bit multiplier of fold.
+FOLD_MULTIPLIER = random.Random(0x616d6361).getrandbits(256) | 1
+
+
+def fold(value):
+    """Returns the 64-bit digest of a non-negative integer of up to 256 bits,
+    e.g. a packed state key of SarsaGame: the top 64 bits of its product with
+    a random odd multiplier modulo 2**256, which two integers share about as
+    rarely as two random digests would. The top half is xored into the bottom
+    one, since the slots of the keys are their lowest bits."""
+
+    digest = (value * FOLD_MULTIPLIER >> 192) & MASK64
+
+    return digest ^ (digest >> 32)
+
+
+def get_state_digest(state):
+    """Returns a deterministic 64-bit integer of a state. Integers of 64 bits
+    are their own digests, and wider ones such as the state keys of
+    SarsaGame are folded; other states, e.g. state strings, are hashed."""
+
+    if isinstance(state, np.integer):
+        state = int(state)
+    if isinstance(state, int) and state >= 0:
+        if state <= MASK64:
+            return state
+        if not state >> 256:
+            return fold(state)
+    if isinstance(state, int):
+        data = state.to_bytes(state.bit_length() // 8 + 1, 'little', signed=True)
+    elif isinstance(state, str):
+        data = state.encode()
+    else:
+        data = repr(state).encode()
+
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+
+
+def get_action_index(action):
+    """Returns the index of an action of SarsaGame in ALL_ACTIONS, or
+    NOMOVE_INDEX if it is the action of a player that can not move."""
+
+    if action[0] == 'Nomove':
+        return NOMOVE_INDEX
+
+    return ACTION_INDEX[tuple(action)]
+
+
+def get_action_salt(action):
+    """Returns the salt of an action."""
+
+    salt = ACTION_SALT.get(action)
+    if salt is None:
+        salt = ACTION_SALTS[get_action_index(action)]
+
+    return salt
+
+
+def get_key(state, action):
+    """Returns the 64-bit key of a (state, action) pair."""
+
+    return (get_state_digest(state) ^ get_action_salt(action)) or 1
+
+
+class QTable:
+    """
+    Hash table of the Q-values of (state, action) pairs, with a value of 0
+    for the pairs never stored. If max_bytes is given, the table never takes
+    more memory than that, and evicts entries to make room for new ones.
+    """
+
+    def __init__(self, capacity=1024, max_bytes=None):
+        self.__max_bytes = max_bytes
+        size = 1
+        while size * MAX_LOAD < capacity and size * 2 <= self.__get_max_size():
+            size *= 2
+        self.__keys = np.zeros(size, dtype=np.uint64)
+        self.__values = np.zeros(size, dtype=np.float32)
+        self.__visits = np.zeros(size, dtype=np.uint32)
+        self.__ticks = np.zeros(size, dtype=np.uint32)
+        self.__count = 0
+        self.__clock = 0
+        self.__evicted = 0
+        self.__set_views()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_QTable__views']
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        # Tables pickled before had no memory budget.
+        if '_QTable__ticks' not in state:
+            self.__ticks = np.zeros(len(self.__keys), dtype=np.uint32)
+            self.__max_bytes = None
+            self.__clock = 0
+            self.__evicted = 0
+        self.__set_views()
+
+    def __len__(self):
+        return self.__count
+
+    def __contains__(self, pair):
+        return self.__find_key(get_key(*pair))[1]
+
+    def get(self, state, action, default=0.0):
+        """Returns the value of a (state, action) pair, or the default if it
+        was never stored."""
+
+        key = (get_state_digest(state) ^ get_action_salt(action)) or 1
+        keys, values, _, _ = self.__views
+        mask = len(keys) - 1
+        slot = key & mask
+        stored = keys[slot]
+        while stored and stored != key:
+            slot = (slot + 1) & mask
+            stored = keys[slot]
+
+        return values[slot] if stored else default
+
+    def get_many(self, state, actions):
+        """Returns the list of the values of the actions of a state, with 0
+        for the pairs never stored. The state is digested only once."""
+
+        digest = get_state_digest(state)
+        keys, values, _, _ = self.__views
+        mask = len(keys) - 1
+        salts = ACTION_SALT
+        result = []
+        for action in actions:
+            salt = salts.get(action)
+            if salt is None:
+                salt = get_action_salt(action)
+            key = (digest ^ salt) or 1
+            slot = key & mask
+            stored = keys[slot]
+            # Probing stops at the key or at an empty slot, whose key is 0.
+            while stored and stored != key:
+                slot = (slot + 1) & mask
+                stored = keys[slot]
+            result.append(values[slot] if stored else 0.0)
+
+        return result
+
+    def set(self, state, action, value):
+        """Stores the value of a (state, action) pair, and counts a visit of
+        the pair."""
+
+        key = (get_state_digest(state) ^ get_action_salt(action)) or 1
+        keys, values, visits, ticks = self.__views
+        mask = len(keys) - 1
+        slot = key & mask
+        stored = keys[slot]
+        while stored and stored != key:
+            slot = (slot + 1) & mask
+            stored = keys[slot]
+        if not stored:
+            if self.__count + 1 > len(keys) * MAX_LOAD:
+                if not self.__grow(1):
+                    self.__evict()
+                slot, _ = self.__find_key(key)
+                keys, values, visits, ticks = self.__views
+            keys[slot] = key
+            self.__count += 1
+        values[slot] = value
+        if visits[slot] < MAX_VISITS:
+            visits[slot] += 1
+        ticks[slot] = self.__tick()
+
+    def get_arrays(self):
+        """Returns the keys, the values and the visits of the stored
+        pairs."""
+
+        occupied = self.__keys != EMPTY
+
+        return (self.__keys[occupied], self.__values[occupied],
+                self.__visits[occupied])
+
+    def get_visited(self):
+        """Returns the keys, the values and the visits of the pairs visited
+        since the visits were last reset."""
+
+        visited = self.__visits > 0
+
+        return (self.__keys[visited], self.__values[visited],
+                self.__visits[visited])
+
+    def reset_visits(self):
+        """Sets the visits of all the pairs to zero, keeping their values."""
+
+        self.__visits[:] = 0
+
+    def merge(self, keys, values, visits):
+        """Merges the pairs of another table, e.g. of a copy of this one
+        trained elsewhere. The value of a pair in both is the average of its
+        two values, weighted by their visits, which add up."""
+
+        self.__store(keys, values, visits, True)
+
+    def update(self, keys, values, visits):
+        """Stores the values of pairs, and adds their visits to theirs."""
+
+        self.__store(keys, values, visits, False)
+
+    def copy(self):
+        """Returns a copy of the table in memory, with the same memory
+        budget."""
+
+        table = QTable.from_slots(*[np.array(array) for array in self.get_slots()],
+                                  self.__count)
+        table.__ticks = self.__ticks.copy()
+        table.__clock = self.__clock
+        table.__max_bytes = self.__max_bytes
+        table.__set_views()
+
+        return table
+
+    def set_max_bytes(self, max_bytes):
+        """Sets the memory budget of the table in bytes, or removes it if
+        None, evicting entries at once if the table is larger."""
+
+        self.__max_bytes = max_bytes
+        if len(self.__keys) > self.__get_max_size():
+            self.__evict()
+
+    def get_max_bytes(self):
+        """Returns the memory budget of the table in bytes, or None."""
+
+        return self.__max_bytes
+
+    def get_evictions(self):
+        """Returns the number of entries evicted so far and the bytes of the
+        slots they took."""
+
+        return self.__evicted, self.__evicted * SLOT_BYTES
+
+    def get_slots(self):
+        """Returns the key, value and visit arrays of all the slots, empty or
+        not."""
+
+        return self.__keys, self.__values, self.__visits
+
+    def get_nbytes(self):
+        """Returns the memory taken by the table in bytes."""
+
+        return (self.__keys.nbytes + self.__values.nbytes +
+                self.__visits.nbytes + self.__ticks.nbytes)
+
+    @classmethod
+    def from_slots(cls, keys, values, visits, count):
+        """Returns the table of the slot arrays of a table with count entries,
+        e.g. mapped from a file. The arrays are used as they are."""
+
+        table = cls.__new__(cls)
+        table.__keys = keys
+        table.__values = values
+        table.__visits = visits
+        table.__ticks = np.zeros(len(keys), dtype=np.uint32)
+        table.__count = count
+        table.__max_bytes = None
+        table.__clock = 0
+        table.__evicted = 0
+        table.__set_views()
+
+        return table
+
+    def __store(self, keys, values, visits, weighted):
+        keys = np.asarray(keys, dtype=np.uint64)
+        values = np.asarray(values, dtype=np.float32)
+        visits = np.asarray(visits, dtype=np.uint32)
+
+        slots, found = self.__find(keys)
+        old = slots[found]
+        old_visits = self.__visits[old].astype(np.float64)
+        new_visits = visits[found].astype(np.float64)
+        total = old_visits + new_visits
+        if weighted:
+            average = (self.__values[old] * old_visits +
+                       values[found] * new_visits) / np.maximum(total, 1)
+            self.__values[old] = np.where(total > 0, average, values[found])
+        else:
+            self.__values[old] = values[found]
+        self.__visits[old] = np.minimum(total, MAX_VISITS)
+        tick = self.__tick()
+        self.__ticks[old] = tick
+
+        new = ~found
+        if new.any():
+            entries = (keys[new], values[new], visits[new],
+                       np.full(int(new.sum()), tick, dtype=np.uint32))
+            if self.__grow(len(entries[0])):
+                self.__insert(*entries)
+            else:
+                # The new pairs are evicted along with the others.
+                self.__evict(entries)
+
+    def __get_max_size(self):
+        """Returns the largest number of slots within the memory budget."""
+
+        if self.__max_bytes is None:
+            return float('inf')
+        size = 8
+        while size * 2 * SLOT_BYTES <= self.__max_bytes:
+            size *= 2
+
+        return size
+
+    def __grow(self, count):
+        """Grows the table within the memory budget to make room for a number
+        of new entries. Returns whether they fit."""
+
+        needed = self.__count + count
+        size = len(self.__keys)
+        while needed > size * MAX_LOAD and size * 2 <= self.__get_max_size():
+            size *= 2
+        if needed > size * MAX_LOAD:
+            return False
+        if size != len(self.__keys):
+            self.__resize(size)
+
+        return True
+
+    def __evict(self, new=None):
+        """Evicts a batch of the least visited entries, the least recently
+        updated first among those visited as often, and rebuilds the table
+        with as many slots as the budget allows. New entries that are not
+        in the table yet can be given to be evicted or kept along with the
+        others."""
+
+        entries = self.__get_entries()
+        if new is not None:
+            entries = [np.concatenate(pair) for pair in zip(entries, new)]
+        keys, values, visits, ticks = entries
+
+        size = self.__get_max_size()
+        kept = min(len(keys), int(size * MAX_LOAD * (1 - EVICTION_FRACTION)))
+        order = np.lexsort((ticks, visits))[len(keys) - kept:]
+        self.__evicted += len(keys) - kept
+        self.__rebuild(size, keys[order], values[order], visits[order],
+                       ticks[order])
+
+    def __tick(self):
+        """Returns the time of an update, counted in updates."""
+
+        if self.__clock == MAX_TICK:
+            # Halving all the times keeps their order, in place so that the
+            # views stay valid.
+            self.__ticks >>= 1
+            self.__clock >>= 1
+        self.__clock += 1
+
+        return self.__clock
+
+    def __get_entries(self):
+        occupied = self.__keys != EMPTY
+
+        return (self.__keys[occupied], self.__values[occupied],
+                self.__visits[occupied], self.__ticks[occupied])
+
+    def __resize(self, size):
+        self.__rebuild(size, *self.__get_entries())
+
+    def __rebuild(self, size, keys, values, visits, ticks):
+        self.__keys = np.zeros(size, dtype=np.uint64)
+        self.__values = np.zeros(size, dtype=np.float32)
+        self.__visits = np.zeros(size, dtype=np.uint32)
+        self.__ticks = np.zeros(size, dtype=np.uint32)
+        self.__count = 0
+        self.__set_views()
+        self.__insert(keys, values, visits, ticks)
+
+    def __insert(self, keys, values, visits, ticks):
+        """Inserts distinct keys that are not in the table, with their values,
+        visits and ticks, all at once. The table must have room for them."""
+
+        mask = len(self.__keys) - 1
+        slots = (keys & np.uint64(mask)).astype(np.intp)
+        pending = np.arange(len(keys))
+        while pending.size:
+            free = pending[self.__keys[slots[pending]] == EMPTY]
+            # Only the first of the keys probing the same free slot takes it.
+            _, first = np.unique(slots[free], return_index=True)
+            placed = free[first]
+            self.__keys[slots[placed]] = keys[placed]
+            self.__values[slots[placed]] = values[placed]
+            self.__visits[slots[placed]] = visits[placed]
+            self.__ticks[slots[placed]] = ticks[placed]
+
+            waiting = np.ones(len(keys), dtype=bool)
+            waiting[placed] = False
+            pending = pending[waiting[pending]]
+            slots[pending] = (slots[pending] + 1) & mask
+        self.__count += len(keys)
+
+    def __set_views(self):
+        """Takes memoryviews of the arrays, which single slots are read and
+        written through as Python scalars much faster than through NumPy."""
+
+        self.__views = (memoryview(self.__keys), memoryview(self.__values),
+                        memoryview(self.__visits), memoryview(self.__ticks))
+
+    def __find_key(self, key):
+        """Returns the slot of a key and whether it is stored there. The slot
+        of a key not found is the empty slot it would take."""
+
+        keys = self.__views[0]
+        mask = len(keys) - 1
+        slot = key & mask
+        while True:
+            stored = keys[slot]
+            if stored == key:
+                return slot, True
+            if stored == EMPTY:
+                return slot, False
+            slot = (slot + 1) & mask
+
+    def __find(self, keys):
+        """Returns the slots of an array of keys and whether they are stored
+        there, probing all the keys at once."""
+
+        mask = len(self.__keys) - 1
+        slots = (keys & np.uint64(mask)).astype(np.intp)
+        stored = self.__keys[slots]
+        found = stored == keys
+        pending = np.flatnonzero(~found & (stored != EMPTY))
+        while pending.size:
+            slots[pending] = (slots[pending] + 1) & mask
+            stored = self.__keys[slots[pending]]
+            hit = stored == keys[pending]
+            found[pending[hit]] = True
+            pending = pending[~hit & (stored != EMPTY)]
+
+        return slots, found
+
+
+def is_table_file(path):
+    """Returns whether a file is a saved Q-table."""
+
+    with open(path, 'rb') as infile:
+        return infile.read(len(MAGIC)) == MAGIC
+
+
+def write_table(path, table, parameters=(0.0, 0.0, 0.0)):
+    """Saves a table and the (epsilon, alpha, gamma) parameters of its agent
+    into a file."""
+
+    keys, values, visits = table.get_slots()
+    with open(path, 'wb') as outfile:
+        header = HEADER.pack(MAGIC, VERSION, len(keys), len(table), *parameters)
+        outfile.write(header.ljust(HEADER_SIZE, b'\0'))
+        outfile.write(keys.astype('<u8').tobytes())
+        outfile.write(values.astype('<f4').tobytes())
+        outfile.write(visits.astype('<u4').tobytes())
+
+
+def read_table(path, mmap=True):
+    """Returns the table saved in a file and the (epsilon, alpha, gamma)
+    parameters of its agent. The table is mapped read-only from the file if
+    mmap, or else read into memory."""
+
+    with open(path, 'rb') as infile:
+        header = infile.read(HEADER.size)
+    if len(header) < HEADER.size or not header.startswith(MAGIC):
+        raise ValueError('{} is not a Q-table file'.format(path))
+    _, version, size, count, *parameters = HEADER.unpack(header)
+    if version != VERSION:
+        raise ValueError('Unsupported Q-table file version: {}'.format(version))
+
+    slots = []
+    offset = HEADER_SIZE
+    for dtype, native in [('<u8', np.uint64), ('<f4', np.float32), ('<u4', np.uint32)]:
+        if mmap:
+            slots.append(np.memmap(path, dtype=dtype, mode='r', offset=offset,
+                                   shape=(size,)))
+        else:
+            array = np.fromfile(path, dtype=dtype, count=size, offset=offset)
+            slots.append(array.astype(native, copy=False))
+        offset += np.dtype(dtype).itemsize * size
+
+    return QTable.from_slots(*slots, count), tuple(parameters)
@@ -14,14 +14,26 @@
 
 import random
 
+import numpy as np
+
+
 class RandomAgent:
     def __init__(self, action_space):
         self.__action_space = action_space
+        self.__rng = np.random.RandomState()
+
+    def seed(self, seed=None):
+        """Seeds the choices of the agent."""
+
+        self.__rng.seed(seed)
+
+        return [seed]
 
-    def make_decision(self, _):
-        """Returns a random action from a list of valid actions."""
+    def make_decision(self, _, mask=None):
+        """Returns a random action from the discrete action space. The mask of
+        valid actions is ignored, invalid actions are replaced by the game."""
 
-        return self.__action_space.sample()
+        return self.__rng.randint(self.__action_space.n)
 
 
 class RandomSarsaAgent:
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    The model registry loads each trained model once per process and shares it
+    among all the agents and environments that use it. Models are keyed by
+    their algorithm, path and modification time, so a model saved again is
+    loaded again.
+"""
+
+import os
+
+from amca.agents.numpy_policy import NumpyPolicy
+
+
+# Class names in stable_baselines of the algorithms, by lowercase name.
+ALGORITHMS = {'a2c': 'A2C', 'acer': 'ACER', 'acktr': 'ACKTR', 'ddpg': 'DDPG',
+              'dqn': 'DQN', 'gail': 'GAIL', 'ppo': 'PPO2', 'sac': 'SAC',
+              'trpo': 'TRPO'}
+
+MODELS = {}
+
+
+def get_algorithm(name):
+    """Returns the stable_baselines class of an algorithm name. stable_baselines
+    and TensorFlow are only imported here, on first use, since importing them
+    takes seconds."""
+
+    if name.lower() not in ALGORITHMS:
+        raise ValueError('Unidentified algorithm chosen')
+
+    import stable_baselines
+
+    return getattr(stable_baselines, ALGORITHMS[name.lower()])
+
+
+def get_model(algorithm, path):
+    """Returns the model of an algorithm saved in a path, loading it if it is
+    not loaded yet or if the file changed since. Policies exported to .npz
+    files are loaded as NumPy policies, without stable_baselines."""
+
+    if algorithm.lower() not in ALGORITHMS:
+        raise ValueError('Unidentified algorithm chosen')
+    path = os.path.abspath(path)
+    key = (ALGORITHMS[algorithm.lower()], path, os.path.getmtime(path))
+
+    if key not in MODELS:
+        # Older versions of the same file are no longer needed.
+        for stale in [other for other in MODELS if other[:2] == key[:2]]:
+            del MODELS[stale]
+        if path.endswith('.npz'):
+            MODELS[key] = NumpyPolicy(path)
+        else:
+            MODELS[key] = get_algorithm(algorithm).load(path)
+
+    return MODELS[key]
+
+
+def clear():
+    """Forgets all the loaded models."""
+
+    MODELS.clear()
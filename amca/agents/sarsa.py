@@ -13,12 +13,53 @@
     https://github.com/vmayoral/basic_reinforcement_learning/blob/master/tutorial2/sarsa.py
 """
 
+import pickle
 import random
 
+from amca.agents.qtable import QTable, is_table_file, read_table, write_table
+from amca.game.sarsa_game import get_state3_key
+
+
+def migrate_q(q):
+    """Returns the QTable of a dict of Q-values keyed by (state, action)
+    pairs, as pickled before, with the state strings of SarsaGame.get_state3
+    replaced by the state keys of SarsaGame.get_canonical_state_key. Each
+    string becomes one key, as get_state3_key tells, so the migration is
+    lossy. Other states are kept as they are."""
+
+    table = QTable(len(q))
+    for (state, action), value in q.items():
+        if isinstance(state, str):
+            try:
+                state = get_state3_key(state)
+            except ValueError:
+                pass
+        table.set(state, action, value)
+
+    return table
+
+
+def load_agent(path, mmap=True):
+    """Returns the SARSA agent saved in a file, either pickled or saved as a
+    Q-table file by SarsaAgent.save. A Q-table file is mapped read-only if
+    mmap, so that the agent can play at once, without reading the table."""
+
+    if not is_table_file(path):
+        with open(path, 'rb') as infile:
+            return pickle.load(infile)
+
+    table, (epsilon, alpha, gamma) = read_table(path, mmap)
+    agent = SarsaAgent(epsilon=epsilon, alpha=alpha, gamma=gamma)
+    agent.q = table
+
+    return agent
+
 
 class SarsaAgent:
-    def __init__(self, actions=None, epsilon=0.2, alpha=0.2, gamma=0.9):
-        self.q = {}
+    def __init__(self, actions=None, epsilon=0.2, alpha=0.2, gamma=0.9,
+                 max_bytes=None):
+        # The Q-table never takes more than max_bytes of memory if given.
+        self.q = QTable(max_bytes=max_bytes)
 
         self.epsilon = epsilon
         self.alpha = alpha
@@ -28,15 +69,27 @@ class SarsaAgent:
         else:
             self.actions = actions
 
+    def __setstate__(self, state):
+        # Agents pickled before kept their Q-values in a dict.
+        if isinstance(state.get('q'), dict):
+            state = dict(state, q=migrate_q(state['q']))
+        self.__dict__.update(state)
+
+    def save(self, path):
+        """Saves the Q-table and the parameters of the agent into a Q-table
+        file."""
+
+        write_table(path, self.q, (self.epsilon, self.alpha, self.gamma))
+
     def getQ(self, state, action):
-        return self.q.get((state, action), 0.0)
+        return self.q.get(state, action, 0.0)
 
     def learnQ(self, state, action, reward, value):
-        oldv = self.q.get((state, action), None)
+        oldv = self.q.get(state, action, None)
         if oldv is None:
-            self.q[(state, action)] = reward
+            self.q.set(state, action, reward)
         else:
-            self.q[(state, action)] = oldv + self.alpha * (value - oldv)
+            self.q.set(state, action, oldv + self.alpha * (value - oldv))
 
     def chooseAction(self, state, actions):
         if len(actions) < 1:
@@ -45,7 +98,7 @@ class SarsaAgent:
         if random.random() < self.epsilon:
             i = random.choice(range(0, len(actions)))
         else:
-            q = [self.getQ(state, a) for a in actions]
+            q = self.q.get_many(state, actions)
             if len(q) > 0:
                 maxQ = max(q)
                 count = q.count(maxQ)
@@ -66,7 +119,7 @@ class SarsaAgent:
             actions = [("Nomove", 0, 0)]
             return ("Nomove", 0, 0)
 
-        q = [self.getQ(state, a) for a in actions]
+        q = self.q.get_many(state, actions)
 
         if len(q) > 0:
             maxQ = max(q)
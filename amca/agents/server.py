@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    The policy server plays a trained model for the opponents of many
+    environments at once. It runs in its own process, collects the decisions
+    asked by its clients and answers them with one prediction per batch, so
+    that the overhead of each TensorFlow call is shared among the workers of a
+    SubprocVecEnv instead of being paid for every move.
+"""
+
+import multiprocessing
+import queue
+import time
+
+import numpy as np
+
+from amca.game import ALL_ACTIONS
+from amca.agents.policy import get_decisions
+from amca.agents.registry import ALGORITHMS, get_model
+
+
+def serve(algorithm, model, deterministic, requests, responses,
+          max_batch_size, max_wait):
+    """Answers the requests of the clients until a None request is received.
+    A batch is predicted once it has max_batch_size requests, or max_wait
+    seconds after its first request."""
+
+    policy = get_model(algorithm, model)
+    running = True
+    while running:
+        request = requests.get()
+        if request is None:
+            break
+
+        batch = [request]
+        deadline = time.monotonic() + max_wait
+        while len(batch) < max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = requests.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                running = False
+                break
+            batch.append(request)
+
+        clients, observations, masks = zip(*batch)
+        actions = get_decisions(policy, observations, masks, deterministic)
+        for client, action in zip(clients, actions):
+            responses[client].put(action)
+
+
+class PolicyServer:
+    """
+    Serves the decisions of a trained model to a fixed number of clients. The
+    clients must be taken with get_client before the worker processes using
+    them are started, e.g.:
+
+        server = PolicyServer('ppo', 'amca/models/amca.pkl', 8)
+        env = SubprocVecEnv([make_env(server.get_client(i)) for i in range(8)])
+        server.start()
+    """
+
+    def __init__(self, algorithm, model, num_clients, max_batch_size=None,
+                 max_wait=0.002, deterministic=False, start_method=None):
+        if algorithm.lower() not in ALGORITHMS:
+            raise ValueError('Unidentified algorithm chosen')
+        if max_batch_size is None:
+            max_batch_size = num_clients
+
+        # SubprocVecEnv pickles the clients into its workers along with the
+        # functions making their environments, which plain queues do not
+        # survive under forkserver and spawn, so the queues are proxies of a
+        # manager process, which can be sent to any process.
+        context = multiprocessing.get_context(start_method)
+        self.__manager = context.Manager()
+        self.__requests = self.__manager.Queue()
+        self.__responses = [self.__manager.Queue() for _ in range(num_clients)]
+        self.__process = context.Process(
+            target=serve, daemon=True,
+            args=(algorithm, model, deterministic, self.__requests,
+                  self.__responses, max_batch_size, max_wait))
+
+    def get_client(self, index):
+        """Returns the agent of the client with the given index."""
+
+        return PolicyClientAgent(index, self.__requests, self.__responses[index])
+
+    def get_num_clients(self):
+        """Returns the number of clients of the server."""
+
+        return len(self.__responses)
+
+    def start(self):
+        """Starts the server process."""
+
+        self.__process.start()
+
+    def close(self):
+        """Stops the server process once it has answered the requests sent
+        before."""
+
+        if self.__process.is_alive():
+            self.__requests.put(None)
+            self.__process.join()
+        self.__manager.shutdown()
+
+
+class PolicyClientAgent:
+    """
+    Agent that takes its actions from a PolicyServer. Each client must be used
+    by one environment at a time, since it waits for its own answer.
+    """
+
+    # Shown the mirrored board as an opponent, see Game.play_opponent.
+    canonical = True
+
+    def __init__(self, index, requests, responses):
+        self.__index = index
+        self.__requests = requests
+        self.__responses = responses
+
+    def make_decision(self, observation, mask=None):
+        """Returns the action chosen by the server for the observation, among
+        the valid actions of the mask if given."""
+
+        observation = np.asarray(observation, dtype=np.float32)
+        if mask is None:
+            mask = np.ones(len(ALL_ACTIONS), dtype=bool)
+        self.__requests.put((self.__index, observation, np.asarray(mask, dtype=bool)))
+
+        return self.__responses.get()
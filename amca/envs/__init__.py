@@ -1,3 +1,3 @@
 # -*- coding: utf-8 -*-
 #!/usr/bin/env python3
-from amca.envs.backgammon_envs import BackgammonHumanEnv, BackgammonPolicyEnv, BackgammonRandomEnv, BackgammonHumanContinuousEnv, BackgammonPolicyContinuousEnv, BackgammonRandomContinuousEnv
+from amca.envs.backgammon_envs import BackgammonHumanEnv, BackgammonPolicyEnv, BackgammonRandomEnv, BackgammonHumanMaskedEnv, BackgammonRandomMaskedEnv, BackgammonRandomCompactEnv, BackgammonRandomMaskedCompactEnv, BackgammonHumanTDEnv, BackgammonRandomTDEnv, BackgammonHumanMaskedTDEnv, BackgammonRandomMaskedTDEnv, BackgammonHumanContinuousEnv, BackgammonPolicyContinuousEnv, BackgammonRandomContinuousEnv
@@ -18,10 +18,33 @@ import gym
 from gym import spaces
 import numpy as np
 
-from amca.game import Game, ALL_ACTIONS
+from amca.game import Game, ALL_ACTIONS, DiceRoller
+from amca.game.dice import spawn_seeds
+from amca.game.game import TD_POINTS, NUM_TD_FEATURES
 from amca.agents import RandomAgent, PolicyAgent, HumanAgent
 
 
+def get_observation_space(masked=False, compact=False, td_gammon=False):
+    """Returns the observation space of the Backgammon environments."""
+
+    if td_gammon:
+        if compact:
+            raise ValueError('The TD-Gammon encoding can not be compact')
+        lower_bound = np.zeros(NUM_TD_FEATURES)
+        upper_bound = np.concatenate([np.tile(TD_POINTS.max(axis=0), 24),
+                                      [7.5, 7.5, 1, 1, 1, 1], [1, ]*12])
+    else:
+        lower_bound = np.array([1, ]*2 + [0, ]*52)
+        upper_bound = np.array([6, ]*2 + [15, ]*4 + [
+            item for sublist in [[2, 15], ]*24 for item in sublist])
+    if masked:
+        lower_bound = np.concatenate([lower_bound, [0, ]*len(ALL_ACTIONS)])
+        upper_bound = np.concatenate([upper_bound, [1, ]*len(ALL_ACTIONS)])
+
+    return spaces.Box(low=lower_bound, high=upper_bound,
+                      dtype=np.uint8 if compact else np.float32)
+
+
 class BackgammonEnv(gym.Env):
     """
     Base class for the Backgammon environment. Defines a Backgammon environment
@@ -47,17 +70,36 @@ class BackgammonEnv(gym.Env):
                .
          point24 color,
          point24 count]
+
+    If masked, the mask of the valid actions (1 for valid, 0 for invalid) is
+    appended to the observation, so that a policy can rule out the invalid
+    actions itself. The mask is also given in the info of every step.
+
+    With td_gammon, the observation is instead the 210-D TD-Gammon encoding of
+    Game.write_td_observation: truncated unary units of the checkers of each
+    color on each point, the bars, the bourne off checkers, the side to move
+    and the two dice one-hot. It is a better input for MLP policies.
+
+    Observations are float32, or uint8 if compact, which takes 4 times less
+    memory in replay buffers. Each reset or step returns a new array, unless
+    reuse_observations is set, in which case they are written into two
+    preallocated arrays used in turns, so that an observation is only valid
+    until the call after the next one. Only set it if the caller copies the
+    observations it keeps.
     """
 
     metadata = {'render.modes': ['human']}
 
-    def __init__(self, opponent, cont=False):
+    def __init__(self, opponent, cont=False, masked=False, compact=False,
+                 td_gammon=False, reuse_observations=False):
         # Action and observation spaces.
-        lower_bound = np.array([1, ]*2 + [0, ]*52)
-        upper_bound = np.array([6, ]*2 + [15, ]*4 + [
-            item for sublist in [[2, 15], ]*24 for item in sublist])
-        self.observation_space = spaces.Box(low=lower_bound, high=upper_bound,
-                                            dtype=np.float32)
+        self.observation_space = get_observation_space(masked, compact, td_gammon)
+        self.__num_features = NUM_TD_FEATURES if td_gammon else 54
+        self.__observations = None
+        if reuse_observations:
+            self.__observations = [np.zeros(self.observation_space.shape,
+                                            dtype=self.observation_space.dtype)
+                                   for _ in range(2)]
 
         if cont:
             self.action_space = spaces.Box(low=np.array([-int((len(ALL_ACTIONS)/2)-1)]),
@@ -72,8 +114,24 @@ class BackgammonEnv(gym.Env):
         self.__time_elapsed = 0
 
         # Game initialization.
+        self.__masked = masked
+        self.__td_gammon = td_gammon
         self.__opponent = opponent
-        self.__game = Game('amca', opponent)
+        self.__dice_roller = DiceRoller()
+        self.__game = Game('amca', opponent, self.__dice_roller, td_gammon)
+
+    def seed(self, seed=None):
+        """Seeds the dice and the random choices of the games, and the
+        opponent if it can be seeded, so that the same seed plays the same
+        games for the same actions. The dice and the opponent get independent
+        seeds derived from it."""
+
+        dice_seed, opponent_seed = spawn_seeds(seed, 2)
+        if hasattr(self.__opponent, 'seed'):
+            self.__opponent.seed(opponent_seed)
+        self.__dice_roller.seed(dice_seed)
+
+        return [seed]
 
     def render(self, mode='human'):
         """Renders the board. 'w' is player1 and 'b' is player2."""
@@ -82,11 +140,11 @@ class BackgammonEnv(gym.Env):
             self.__game.print_game()
 
     def reset(self):
-        """Restarts the game."""
+        """Restarts the game in place."""
 
-        self.__game = Game(self, self.__opponent)
+        self.__game.reset()
 
-        return self.__game.get_observation()
+        return self.get_observation(self.get_action_mask())
 
     def step(self, actionint):
         """Run one timestep of the environment's dynamics. When end of
@@ -109,14 +167,39 @@ class BackgammonEnv(gym.Env):
             actionint = int(actionint)
 
         reward = self.__game.player_turn(actionint)
-        observation = self.__game.get_observation()
+        mask = self.get_action_mask()
+        observation = self.get_observation(mask)
         done = self.__game.get_done()
         info = self.get_info()
-        if done:
-            self.reset()
+        info['action mask'] = mask
 
         return (observation, reward, done, info)
 
+    def get_action_mask(self):
+        """Returns a boolean NumPy array over the discrete actions that is True
+        for the valid actions of the current state."""
+
+        return self.__game.get_action_mask()
+
+    def get_observation(self, mask):
+        """Returns the observation of the game, with the mask of the valid
+        actions appended if the environment is masked."""
+
+        if self.__observations is None:
+            observation = np.zeros(self.observation_space.shape,
+                                   dtype=self.observation_space.dtype)
+        else:
+            observation = self.__observations.pop(0)
+            self.__observations.append(observation)
+        if self.__td_gammon:
+            self.__game.write_td_observation(observation)
+        else:
+            self.__game.write_observation(observation)
+        if self.__masked:
+            observation[self.__num_features:] = mask
+
+        return observation
+
     def get_info(self):
         """Returns useful info for debugging, etc."""
 
@@ -125,30 +208,109 @@ class BackgammonEnv(gym.Env):
 
 
 class BackgammonHumanEnv(BackgammonEnv):
-    def __init__(self, opponent=HumanAgent()):
-        super().__init__(opponent)
+    def __init__(self, opponent=None, reuse_observations=False):
+        if opponent is None:
+            opponent = HumanAgent()
+        super().__init__(opponent, reuse_observations=reuse_observations)
 
 
 class BackgammonRandomEnv(BackgammonEnv):
-    def __init__(self, opponent=RandomAgent(spaces.Discrete(len(ALL_ACTIONS)))):
-        super().__init__(opponent)
+    def __init__(self, opponent=None, reuse_observations=False):
+        if opponent is None:
+            opponent = RandomAgent(spaces.Discrete(len(ALL_ACTIONS)))
+        super().__init__(opponent, reuse_observations=reuse_observations)
 
 
 class BackgammonPolicyEnv(BackgammonEnv):
-    def __init__(self, opponent=PolicyAgent('ppo', 'amca/models/amca.pkl')):
-        super().__init__(opponent)
+    def __init__(self, opponent=None, reuse_observations=False):
+        if opponent is None:
+            opponent = PolicyAgent('ppo', 'amca/models/amca.pkl')
+        super().__init__(opponent, reuse_observations=reuse_observations)
+
+
+class BackgammonHumanMaskedEnv(BackgammonEnv):
+    def __init__(self, opponent=None, reuse_observations=False):
+        if opponent is None:
+            opponent = HumanAgent()
+        super().__init__(opponent, masked=True,
+                         reuse_observations=reuse_observations)
+
+
+class BackgammonRandomMaskedEnv(BackgammonEnv):
+    def __init__(self, opponent=None, reuse_observations=False):
+        if opponent is None:
+            opponent = RandomAgent(spaces.Discrete(len(ALL_ACTIONS)))
+        super().__init__(opponent, masked=True,
+                         reuse_observations=reuse_observations)
+
+
+class BackgammonRandomCompactEnv(BackgammonEnv):
+    def __init__(self, opponent=None, reuse_observations=False):
+        if opponent is None:
+            opponent = RandomAgent(spaces.Discrete(len(ALL_ACTIONS)))
+        super().__init__(opponent, compact=True,
+                         reuse_observations=reuse_observations)
+
+
+class BackgammonRandomMaskedCompactEnv(BackgammonEnv):
+    def __init__(self, opponent=None, reuse_observations=False):
+        if opponent is None:
+            opponent = RandomAgent(spaces.Discrete(len(ALL_ACTIONS)))
+        super().__init__(opponent, masked=True, compact=True,
+                         reuse_observations=reuse_observations)
+
+
+class BackgammonHumanTDEnv(BackgammonEnv):
+    def __init__(self, opponent=None, reuse_observations=False):
+        if opponent is None:
+            opponent = HumanAgent()
+        super().__init__(opponent, td_gammon=True,
+                         reuse_observations=reuse_observations)
+
+
+class BackgammonRandomTDEnv(BackgammonEnv):
+    def __init__(self, opponent=None, reuse_observations=False):
+        if opponent is None:
+            opponent = RandomAgent(spaces.Discrete(len(ALL_ACTIONS)))
+        super().__init__(opponent, td_gammon=True,
+                         reuse_observations=reuse_observations)
+
+
+class BackgammonHumanMaskedTDEnv(BackgammonEnv):
+    def __init__(self, opponent=None, reuse_observations=False):
+        if opponent is None:
+            opponent = HumanAgent()
+        super().__init__(opponent, masked=True, td_gammon=True,
+                         reuse_observations=reuse_observations)
+
+
+class BackgammonRandomMaskedTDEnv(BackgammonEnv):
+    def __init__(self, opponent=None, reuse_observations=False):
+        if opponent is None:
+            opponent = RandomAgent(spaces.Discrete(len(ALL_ACTIONS)))
+        super().__init__(opponent, masked=True, td_gammon=True,
+                         reuse_observations=reuse_observations)
 
 
 class BackgammonHumanContinuousEnv(BackgammonEnv):
-    def __init__(self, opponent=HumanAgent()):
-        super().__init__(opponent, cont=True)
+    def __init__(self, opponent=None, reuse_observations=False):
+        if opponent is None:
+            opponent = HumanAgent()
+        super().__init__(opponent, cont=True,
+                         reuse_observations=reuse_observations)
 
 
 class BackgammonPolicyContinuousEnv(BackgammonEnv):
-    def __init__(self, opponent=RandomAgent(spaces.Discrete(len(ALL_ACTIONS)))):
-        super().__init__(opponent, cont=True)
+    def __init__(self, opponent=None, reuse_observations=False):
+        if opponent is None:
+            opponent = PolicyAgent('ppo', 'amca/models/amca.pkl')
+        super().__init__(opponent, cont=True,
+                         reuse_observations=reuse_observations)
 
 
 class BackgammonRandomContinuousEnv(BackgammonEnv):
-    def __init__(self, opponent=PolicyAgent('ppo', 'amca/models/amca.pkl')):
-        super().__init__(opponent, cont=True)
+    def __init__(self, opponent=None, reuse_observations=False):
+        if opponent is None:
+            opponent = RandomAgent(spaces.Discrete(len(ALL_ACTIONS)))
+        super().__init__(opponent, cont=True,
+                         reuse_observations=reuse_observations)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    This file contains a vectorized Backgammon environment. It plays many games
+    against a random opponent at once with the batch engine, in a single
+    process, and can be used in place of DummyVecEnv or SubprocVecEnv.
+"""
+
+import csv
+import json
+import os
+import time
+
+from gym import spaces
+import numpy as np
+from stable_baselines.common.vec_env import VecEnv
+
+from amca.game import ALL_ACTIONS
+from amca.game.batch import BatchGame
+from amca.envs.backgammon_envs import get_observation_space
+
+
+class BackgammonVecEnv(VecEnv):
+    """
+    Vectorized version of BackgammonRandomEnv, with the same discrete action
+    space and observations, masked, compact or TD-Gammon encoded as in
+    BackgammonEnv. Finished games are restarted automatically; the last
+    observation of a game is given in the info of its final step, with the
+    episode reward and length as the Monitor wrapper gives them.
+
+    If a log directory is given, the finished games are also logged there in
+    the format of the Monitor wrapper, so that they can be plotted with
+    load_results.
+    """
+
+    def __init__(self, num_envs, seed=None, masked=False, compact=False,
+                 td_gammon=False, log_directory=None):
+        observation_space = get_observation_space(masked, compact, td_gammon)
+        action_space = spaces.Discrete(len(ALL_ACTIONS))
+        super().__init__(num_envs, observation_space, action_space)
+
+        self.__masked = masked
+        self.__td_gammon = td_gammon
+        self.__game = BatchGame(num_envs, seed)
+        self.__actions = None
+        self.__episode_rewards = np.zeros(num_envs, dtype=np.float64)
+        self.__episode_lengths = np.zeros(num_envs, dtype=np.int64)
+        self.__start_time = time.time()
+
+        self.__log_file = None
+        self.__logger = None
+        if log_directory is not None:
+            os.makedirs(log_directory, exist_ok=True)
+            self.__log_file = open(os.path.join(log_directory, 'vec.monitor.csv'), 'wt')
+            self.__log_file.write('#%s\n' % json.dumps(
+                {'t_start': self.__start_time, 'env_id': 'BackgammonVecEnv'}))
+            self.__logger = csv.DictWriter(self.__log_file, fieldnames=('r', 'l', 't'))
+            self.__logger.writeheader()
+            self.__log_file.flush()
+
+    def get_action_masks(self):
+        """Returns the (N, len(ALL_ACTIONS)) boolean masks of the valid
+        actions of every game."""
+
+        return self.__game.get_action_masks()
+
+    def get_observations(self):
+        """Returns the observations of every game, with their masks appended
+        if masked."""
+
+        dtype = self.observation_space.dtype
+        if self.__td_gammon:
+            observations = self.__game.get_td_observations()
+        else:
+            observations = self.__game.get_observations(dtype)
+        if self.__masked:
+            observations = np.concatenate(
+                [observations, self.get_action_masks().astype(dtype)], axis=1)
+
+        return observations
+
+    def reset(self):
+        """Restarts all the games."""
+
+        self.__game.reset()
+        self.__episode_rewards[:] = 0
+        self.__episode_lengths[:] = 0
+
+        return self.get_observations()
+
+    def step_async(self, actions):
+        self.__actions = actions
+
+    def step_wait(self):
+        rewards, dones = self.__game.step(self.__actions)
+        observations = self.get_observations()
+        infos = [{} for _ in range(self.num_envs)]
+
+        self.__episode_rewards += rewards
+        self.__episode_lengths += 1
+        if dones.any():
+            now = round(time.time() - self.__start_time, 6)
+            for index in np.flatnonzero(dones):
+                episode = {'r': round(float(self.__episode_rewards[index]), 6),
+                           'l': int(self.__episode_lengths[index]),
+                           't': now}
+                infos[index]['terminal_observation'] = observations[index]
+                infos[index]['episode'] = episode
+                if self.__logger is not None:
+                    self.__logger.writerow(episode)
+            if self.__log_file is not None:
+                self.__log_file.flush()
+
+            self.__game.reset(dones)
+            self.__episode_rewards[dones] = 0
+            self.__episode_lengths[dones] = 0
+            observations = self.get_observations()
+
+        return observations, rewards, dones, infos
+
+    def close(self):
+        if self.__log_file is not None:
+            self.__log_file.close()
+            self.__log_file = None
+
+    def seed(self, seed=None):
+        """Seeds the dice and the opponent of all the games."""
+
+        self.__game.seed(seed)
+
+        return [seed] * self.num_envs
+
+    def get_attr(self, attr_name, indices=None):
+        return [getattr(self, attr_name)] * len(self.__indices(indices))
+
+    def set_attr(self, attr_name, value, indices=None):
+        setattr(self, attr_name, value)
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        result = getattr(self, method_name)(*method_args, **method_kwargs)
+
+        return [result] * len(self.__indices(indices))
+
+    def __indices(self, indices):
+        if indices is None:
+            return range(self.num_envs)
+        if isinstance(indices, int):
+            return [indices]
+
+        return indices
@@ -1,3 +1,6 @@
-from amca.game.game import Game, ALL_ACTIONS, roll_dice
+from amca.game.game import Game, ALL_ACTIONS, ACTION_INDEX, roll_dice
 from amca.game.board import Board, Point
-from amca.game.sarsa_game import SarsaGame
\ No newline at end of file
+from amca.game.sarsa_game import SarsaGame
+from amca.game.turns import get_turns
+from amca.game.batch import BatchGame, get_batch_actions
+from amca.game.dice import DiceRoller
\ No newline at end of file
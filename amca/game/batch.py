@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    This file plays many backgammon games at once with NumPy. A batch of boards
+    is an (N, 28) int8 array laid out like the Board class, and a batch of dice
+    is an (N, 4) array of the dice left in each game, in order, padded with 0.
+
+    Actions are handled as columns of the distinct actions of ALL_ACTIONS. For
+    a color, every action changes the board by a fixed vector of 28 slots,
+    including hits since the hit point always holds a single opponent checker,
+    so applying actions to a batch is a single addition.
+"""
+
+import numpy as np
+
+from amca.game.board import INITIAL_POINTS, NUM_SLOTS, SIGNS, BARS, OFFS, OPPONENTS
+from amca.game.game import ALL_ACTIONS, ACTION_INDEX, TD_POINTS, TD_DICE, NUM_TD_FEATURES
+
+
+MOVE, HIT, BEAROFF, REENTER, REENTER_HIT = range(5)
+KINDS = {'move': MOVE, 'hit': HIT, 'bearoff': BEAROFF, 'reenter': REENTER,
+         'reenter_hit': REENTER_HIT}
+
+# ALL_ACTIONS index of each column, and column of each ALL_ACTIONS index.
+COLUMN_ACTIONS = np.array(sorted(ACTION_INDEX.values()))
+ACTION_COLUMNS = np.zeros(len(ALL_ACTIONS), dtype=np.int64)
+ACTION_COLUMNS[COLUMN_ACTIONS] = np.arange(len(COLUMN_ACTIONS))
+for _actionint, _action in enumerate(ALL_ACTIONS):
+    ACTION_COLUMNS[_actionint] = ACTION_COLUMNS[ACTION_INDEX[_action]]
+
+
+def action_geometry(color):
+    """Returns the arrays describing every action column for a color:
+    'kind', 'source' and 'target' slots, 'distance' (the roll that plays the
+    action, or the lowest roll that bears the checker off), 'reward' (of hits,
+    other actions are rewarded with their roll) and 'delta', the (A, 28) change
+    of the board."""
+
+    sign = SIGNS[color]
+    num_columns = len(COLUMN_ACTIONS)
+    geometry = {'kind': np.zeros(num_columns, dtype=np.int64),
+                'source': np.zeros(num_columns, dtype=np.int64),
+                'target': np.zeros(num_columns, dtype=np.int64),
+                'distance': np.zeros(num_columns, dtype=np.int64),
+                'reward': np.zeros(num_columns, dtype=np.float32),
+                'delta': np.zeros((num_columns, NUM_SLOTS), dtype=np.int8)}
+
+    for column, actionint in enumerate(COLUMN_ACTIONS):
+        action = ALL_ACTIONS[actionint]
+        kind = KINDS[action[0]]
+        geometry['kind'][column] = kind
+        delta = geometry['delta'][column]
+
+        if kind in [MOVE, HIT]:
+            source, target = action[1], action[2]
+            if color == 'w':
+                distance = source - target
+            else:
+                distance = target - source
+            delta[source] -= sign
+            if kind == MOVE:
+                delta[target] += sign
+            else:
+                delta[target] += 2*sign
+                delta[BARS[OPPONENTS[color]]] -= sign
+                geometry['reward'][column] = source if color == 'w' else 24-source
+        elif kind == BEAROFF:
+            source = target = action[1]
+            distance = source + 1 if color == 'w' else 24 - source
+            delta[source] -= sign
+            delta[OFFS[color]] += sign
+        else:
+            source = target = action[1]
+            distance = 24 - target if color == 'w' else target + 1
+            delta[BARS[color]] -= sign
+            if kind == REENTER:
+                delta[target] += sign
+            else:
+                delta[target] += 2*sign
+                delta[BARS[OPPONENTS[color]]] -= sign
+                geometry['reward'][column] = 24
+
+        geometry['source'][column] = source
+        geometry['target'][column] = target
+        # Backward moves are never played, whatever the roll.
+        geometry['distance'][column] = distance if distance > 0 else 25
+
+    return geometry
+
+
+GEOMETRY = {'w': action_geometry('w'), 'b': action_geometry('b')}
+
+# Slots whose checkers are outside of the home board of each color.
+OUTSIDE = {'w': np.array(list(range(6, 24)) + [BARS['w']]),
+           'b': np.array(list(range(0, 18)) + [BARS['b']])}
+
+
+def get_legal_masks(boards, color, dice):
+    """Returns an (N, K, A) boolean array of the action columns a color can
+    play on each of N boards with each of its K dice. Dice of 0 play
+    nothing."""
+
+    geometry = GEOMETRY[color]
+    kind = geometry['kind']
+    signed = boards.astype(np.int16) * SIGNS[color]
+
+    on_bar = (signed[:, BARS[color]] > 0)[:, None]
+    can_bearoff = (np.maximum(signed[:, OUTSIDE[color]], 0).sum(axis=1) == 0)[:, None]
+    own_source = signed[:, geometry['source']] > 0
+    target = signed[:, geometry['target']]
+    open_target = target >= 0
+    blot_target = target == -1
+
+    moving = own_source & ~on_bar
+    exact = moving & (((kind == MOVE) & open_target) |
+                      ((kind == HIT) & blot_target))
+    exact |= on_bar & (((kind == REENTER) & open_target) |
+                       ((kind == REENTER_HIT) & blot_target))
+    bearing = moving & can_bearoff & (kind == BEAROFF)
+
+    rolls = np.asarray(dice)[:, :, None]
+    distance = geometry['distance']
+
+    return ((exact[:, None, :] & (distance == rolls)) |
+            (bearing[:, None, :] & (distance <= rolls)))
+
+
+def apply_actions(boards, color, columns, active=None):
+    """Applies an action column of a color to each of N boards in place. Only
+    the boards where active is True are changed, if given."""
+
+    delta = GEOMETRY[color]['delta'][columns]
+    if active is not None:
+        delta = delta * active[:, None]
+    boards += delta
+
+
+def get_batch_actions(boards, dice, color='w'):
+    """Returns the valid actions of a color on a batch of positions, and the
+    afterstates they lead to. The boards are an (N, 28) array of Board arrays,
+    as given by Board.get_array, and the dice an (N, K) array of the dice left
+    in each position, padded with 0.
+
+    Returns a tuple of (masks, positions, actionints, rolls, afterstates):
+    masks is the (N, len(ALL_ACTIONS)) boolean array of the valid actions of
+    each position, marked at their first index like Game.get_action_mask, and
+    the other four list the M valid actions of all positions together: the
+    (M, ) row of their position, their index in ALL_ACTIONS, the dice they
+    play, and the (M, 28) int8 boards after playing them."""
+
+    boards = np.asarray(boards, dtype=np.int8).reshape(-1, NUM_SLOTS)
+    dice = np.asarray(dice).reshape(len(boards), -1)
+    legal = get_legal_masks(boards, color, dice)
+    valid = legal.any(axis=1)
+
+    masks = np.zeros((len(boards), len(ALL_ACTIONS)), dtype=bool)
+    masks[:, COLUMN_ACTIONS] = valid
+
+    positions, columns = np.nonzero(valid)
+    slots = legal[positions, :, columns].argmax(axis=1)
+    rolls = dice[positions, slots]
+    afterstates = boards[positions] + GEOMETRY[color]['delta'][columns]
+
+    return masks, positions, COLUMN_ACTIONS[columns], rolls, afterstates
+
+
+def get_done(boards):
+    """Returns an (N, ) boolean array of the boards where a color has no
+    checkers left on the points or the bar."""
+
+    points = boards[:, :24]
+    w_left = (points > 0).any(axis=1) | (boards[:, BARS['w']] != 0)
+    b_left = (points < 0).any(axis=1) | (boards[:, BARS['b']] != 0)
+
+    return ~(w_left & b_left)
+
+
+def remove_dice(dice, rows, slots):
+    """Removes one dice from some of the games, keeping the rest in order."""
+
+    dice[rows, slots] = 0
+    order = np.argsort(dice[rows] == 0, axis=1, kind='stable')
+    dice[rows] = np.take_along_axis(dice[rows], order, axis=1)
+
+
+class BatchGame:
+    """Plays N games at once. Player 1 plays white and is the privileged player
+    taking actions, as in Game. The opponent plays black, choosing its actions
+    as a RandomAgent does in Game."""
+
+    def __init__(self, num_games, seed=None):
+        self.__num_games = num_games
+        self.__rng = np.random.RandomState(seed)
+        self.__boards = np.zeros((num_games, NUM_SLOTS), dtype=np.int8)
+        self.__dice = np.zeros((num_games, 4), dtype=np.int8)
+        self.reset()
+
+    def seed(self, seed=None):
+        """Seeds the dice and the opponent of all the games."""
+
+        self.__rng.seed(seed)
+
+    def get_boards(self):
+        """Returns the (N, 28) array of boards."""
+
+        return self.__boards
+
+    def get_dice(self):
+        """Returns the (N, 4) array of the dice left, padded with 0."""
+
+        return self.__dice
+
+    def reset(self, rows=None):
+        """Restarts all the games, or those where rows is True. The higher
+        dice roll starts, which is either player with the same chance."""
+
+        if rows is None:
+            rows = np.ones(self.__num_games, dtype=bool)
+        self.__boards[rows] = INITIAL_POINTS
+        self.__dice[rows] = 0
+
+        opponent_starts = rows & (self.__rng.rand(self.__num_games) < 0.5)
+        self.opponent_turn(opponent_starts)
+        self.roll_dice(rows & ~opponent_starts)
+
+    def roll_dice(self, rows):
+        """Rolls the dice of the games where rows is True."""
+
+        count = int(np.count_nonzero(rows))
+        dice = self.__rng.randint(1, 7, size=(count, 2))
+        rolled = np.zeros((count, 4), dtype=np.int8)
+        rolled[:, :2] = dice
+        doubles = dice[:, 0] == dice[:, 1]
+        rolled[doubles, 2:] = dice[doubles, :1]
+        self.__dice[rows] = rolled
+
+    def get_action_masks(self):
+        """Returns an (N, len(ALL_ACTIONS)) boolean array of the valid actions
+        of player 1. Actions listed more than once in ALL_ACTIONS are only
+        marked at their first index."""
+
+        masks = np.zeros((self.__num_games, len(ALL_ACTIONS)), dtype=bool)
+        legal = get_legal_masks(self.__boards, 'w', self.__dice)
+        masks[:, COLUMN_ACTIONS] = legal.any(axis=1)
+
+        return masks
+
+    def get_observations(self, dtype=np.float32):
+        """Returns the (N, 54) observations of the games, laid out as in
+        Game.get_observation."""
+
+        boards = self.__boards
+        points = boards[:, :24]
+        observations = np.zeros((self.__num_games, 54), dtype=dtype)
+        observations[:, 0:2] = self.__dice[:, :2]
+        observations[:, 2] = boards[:, BARS['w']]
+        observations[:, 3] = -boards[:, BARS['b']]
+        observations[:, 4] = boards[:, OFFS['w']]
+        observations[:, 5] = -boards[:, OFFS['b']]
+        observations[:, 6::2] = np.where(points > 0, 1, np.where(points < 0, 2, 0))
+        observations[:, 7::2] = np.abs(points)
+
+        return observations
+
+    def get_td_observations(self):
+        """Returns the (N, 210) float32 TD-Gammon encodings of the games,
+        laid out as in Game.write_td_observation. Player 1 is always to move."""
+
+        boards = self.__boards
+        dice = self.__dice
+        observations = np.zeros((self.__num_games, NUM_TD_FEATURES), dtype=np.float32)
+        observations[:, 0:192] = TD_POINTS[boards[:, :24]].reshape(-1, 192)
+        observations[:, 192] = boards[:, BARS['w']]/2
+        observations[:, 193] = -boards[:, BARS['b']]/2
+        observations[:, 194] = boards[:, OFFS['w']]/15
+        observations[:, 195] = -boards[:, OFFS['b']]/15
+        observations[:, 196] = 1
+        observations[:, 198:210] = TD_DICE[dice[:, 0], dice[:, 1]]
+
+        return observations
+
+    def get_done(self):
+        """Returns an (N, ) boolean array of the games that are over."""
+
+        return get_done(self.__boards)
+
+    def step(self, actionints):
+        """Plays an action of player 1 in every game, following the rules of
+        Game.player_turn: an invalid action is replaced by a random valid one
+        and rewarded -10, and when player 1 runs out of dice or valid actions
+        the opponent plays its turn. Returns the (N, ) rewards and dones."""
+
+        rows = np.arange(self.__num_games)
+        geometry = GEOMETRY['w']
+        legal = get_legal_masks(self.__boards, 'w', self.__dice)
+        valid = legal.any(axis=1)
+        playing = valid.any(axis=1)
+
+        columns = ACTION_COLUMNS[np.asarray(actionints, dtype=np.int64).reshape(-1)]
+        chosen = valid[rows, columns] & playing
+        columns = np.where(chosen, columns, self.random_columns(legal))
+
+        slots = legal[rows, :, columns].argmax(axis=1)
+        rolls = self.__dice[rows, slots].astype(np.float32)
+        kinds = geometry['kind'][columns]
+        rewards = np.where((kinds == HIT) | (kinds == REENTER_HIT),
+                           geometry['reward'][columns], rolls)
+        rewards = np.where(chosen, rewards, -10.0)
+        rewards = np.where(playing, rewards, 0.0).astype(np.float32)
+
+        apply_actions(self.__boards, 'w', columns, playing)
+        remove_dice(self.__dice, rows[playing], slots[playing])
+        self.__dice[~playing] = 0
+
+        self.opponent_turn(self.__dice[:, 0] == 0)
+
+        return rewards, self.get_done()
+
+    def opponent_turn(self, rows):
+        """Plays the whole turn of the opponent in the games where rows is
+        True, then rolls the dice of player 1 in those games."""
+
+        self.roll_dice(rows)
+        # Black always has dice in the rows rolled for it, at most 4.
+        playing = rows.copy()
+        for _ in range(4):
+            playing &= (self.__dice[:, 0] > 0) & ~self.get_done()
+            if not playing.any():
+                break
+            indices = np.flatnonzero(playing)
+            boards = self.__boards[indices]
+            legal = get_legal_masks(boards, 'b', self.__dice[indices])
+            valid = legal.any(axis=1)
+            moving = valid.any(axis=1)
+
+            columns = self.opponent_columns(legal)
+            slots = legal[np.arange(len(indices)), :, columns].argmax(axis=1)
+            apply_actions(boards, 'b', columns, moving)
+            self.__boards[indices] = boards
+            remove_dice(self.__dice, indices[moving], slots[moving])
+            self.__dice[indices[~moving]] = 0
+
+        self.__dice[rows] = 0
+        self.roll_dice(rows)
+
+    def opponent_columns(self, legal):
+        """Returns the action columns of the opponent, given the (N, K, A)
+        legal columns of each of its dice. As a RandomAgent in Game, it picks
+        one of ALL_ACTIONS uniformly, and an invalid one is replaced as by
+        random_columns, so that actions listed more than once in ALL_ACTIONS
+        are picked more often."""
+
+        actionints = self.__rng.randint(len(ALL_ACTIONS), size=len(legal))
+        columns = ACTION_COLUMNS[actionints]
+        chosen = legal.any(axis=1)[np.arange(len(legal)), columns]
+
+        return np.where(chosen, columns, self.random_columns(legal))
+
+    def random_columns(self, legal):
+        """Returns a random valid action column of each row of an (N, K, A)
+        array of the legal columns of each dice, picked as by
+        Game.get_random_action: a random dice among those with valid actions,
+        then a random valid action of that dice. Rows without valid actions
+        get column 0."""
+
+        rows = np.arange(len(legal))
+        scores = self.__rng.rand(*legal.shape[:2])
+        scores[~legal.any(axis=2)] = -1
+        dice_legal = legal[rows, scores.argmax(axis=1)]
+
+        scores = self.__rng.rand(*dice_legal.shape)
+        scores[~dice_legal] = -1
+
+        return scores.argmax(axis=1)
@@ -9,122 +9,599 @@
     Faculty of Engineering and Natural Sciences
     Sabanci University
 
-    The backgammon board data structure is defined here. It is a list made of 24
-    Points, a class that is also defined here. A point can have a maximum of 15
-    checkers in it. A point has two properties:
-    1) 'color', which must be either 'w', 'b', or None
-    2) 'count', which is an integer ranging from 0 to 15
+    The backgammon board data structure is defined here. It is a single array of
+    28 signed small integers:
+    1) slots 0 to 23 are the points of the board,
+    2) slots 24 and 25 are the bars of white and black respectively,
+    3) slots 26 and 27 are the checkers bourne off by white and black.
+    The magnitude of a slot is the number of checkers in it, ranging from 0 to
+    15, and its sign is the color: positive for 'w' and negative for 'b'.
+
+    Along with the array, the board keeps the following up to date in each of
+    its update methods, so that they can be looked up instead of recomputed:
+    1) the points occupied by each color and the blots of each color, as
+       24-bit masks,
+    2) the number of checkers of each color on the points,
+    3) the pip count of each color, counting 25 for a checker on the bar,
+    4) the number of checkers of each color outside of its home board,
+       counting the bar, which is 0 exactly when the color can bear off,
+    5) a 64-bit Zobrist hash of the position, to be used as a cache key, and
+       the hash of its mirror image.
+
+    The mirror image of a position swaps the colors and reverses the points, so
+    that black sees its checkers as white would. Positions are canonical from
+    the point of view of the side to move: as they are for white, mirrored for
+    black.
+
+    The Point class is kept to exchange single points with older code.
 """
 
+from array import array
+import random
 import warnings
 
+import numpy as np
+
+
+# Slot indices of the bars and the bourne off checkers.
+W_BAR = 24
+B_BAR = 25
+W_OFF = 26
+B_OFF = 27
+NUM_SLOTS = 28
+
+# Mask with a bit set for each of the 24 points.
+FULL_MASK = (1 << 24) - 1
+
+SIGNS = {'w': 1, 'b': -1}
+BARS = {'w': W_BAR, 'b': B_BAR}
+OFFS = {'w': W_OFF, 'b': B_OFF}
+OPPONENTS = {'w': 'b', 'b': 'w'}
+
+# Slot of the mirror image of each slot.
+MIRROR_SLOTS = tuple(range(23, -1, -1)) + (B_BAR, W_BAR, B_OFF, W_OFF)
+
+INITIAL_POINTS = (-2, 0, 0, 0, 0, 5,
+                  0, 3, 0, 0, 0, -5,
+                  5, 0, 0, 0, -3, 0,
+                  -5, 0, 0, 0, 0, 2,
+                  0, 0, 0, 0)
+
+# Pips and home board membership of a single checker in each slot. White moves
+# from 23 towards 0 and bears off from 0 to 5, black moves from 0 towards 23
+# and bears off from 18 to 23.
+W_PIPS = tuple(range(1, 25)) + (25, 0, 0, 0)
+B_PIPS = tuple(range(24, 0, -1)) + (0, 25, 0, 0)
+W_OUTSIDE = (0, )*6 + (1, )*18 + (1, 0, 0, 0)
+B_OUTSIDE = (1, )*18 + (0, )*6 + (0, 1, 0, 0)
+
+
+def zobrist_keys(seed=0x616d6361):
+    """Returns the random 64-bit keys of the Zobrist hash. The seed is fixed so
+    that hashes are the same across processes and runs.
+
+    ZOBRIST[slot][value] is the key of a slot holding a signed value; negative
+    values index from the end of the list. Empty slots have a key of 0. SIDE is
+    the key of black being the side to move, and DICE[roll] the key of a
+    single dice roll."""
+
+    rng = random.Random(seed)
+    zobrist = []
+    for _ in range(NUM_SLOTS):
+        keys = [rng.getrandbits(64) for _ in range(31)]
+        keys[0] = 0
+        zobrist.append(tuple(keys))
+    side = rng.getrandbits(64)
+    dice = (0, ) + tuple(rng.getrandbits(64) for _ in range(6))
+
+    return tuple(zobrist), side, dice
+
+
+ZOBRIST, ZOBRIST_SIDE, ZOBRIST_DICE = zobrist_keys()
+
+
+def action_tables():
+    """Returns the lookup tables of single dice actions. For a color and a
+    roll, the table is a tuple of:
+    1) the mask of the sources whose target is on the board,
+    2) the mask of the sources a checker can be bourne off from,
+    3) the pairs of action and reward tables of each kind and byte of a mask
+       of sources. Pair [3*chunk + kind], with kind 0 for 'move', 1 for 'hit'
+       and 2 for 'bearoff', maps the value of byte chunk of a mask to the
+       actions and rewards of the sources set in it, in order."""
+
+    tables = {}
+    for color in ['w', 'b']:
+        tables[color] = {}
+        for roll in range(1, 7):
+            if color == 'w':
+                onboard = FULL_MASK & ~((1 << roll) - 1)
+                bearoff_sources = (1 << roll) - 1
+            else:
+                onboard = (1 << (24 - roll)) - 1
+                bearoff_sources = FULL_MASK & ~onboard
+
+            kind_actions = {'move': [], 'hit': [], 'bearoff': []}
+            kind_rewards = {'move': [], 'hit': [], 'bearoff': []}
+            for index in range(24):
+                target = index - roll if color == 'w' else index + roll
+                kind_actions['move'].append(('move', index, target))
+                kind_rewards['move'].append(roll)
+                kind_actions['hit'].append(('hit', index, target))
+                kind_rewards['hit'].append(index if color == 'w' else 24-index)
+                kind_actions['bearoff'].append(('bearoff', index))
+                kind_rewards['bearoff'].append(roll)
+
+            byte_tables = []
+            for chunk in range(3):
+                for kind in ['move', 'hit', 'bearoff']:
+                    # The sources of a byte are its lowest source followed by
+                    # the sources of the byte without it.
+                    byte_actions = [()]
+                    byte_rewards = [()]
+                    for byte in range(1, 256):
+                        lowest = byte & -byte
+                        index = 8*chunk + lowest.bit_length() - 1
+                        byte_actions.append((kind_actions[kind][index], ) +
+                                            byte_actions[byte ^ lowest])
+                        byte_rewards.append((kind_rewards[kind][index], ) +
+                                            byte_rewards[byte ^ lowest])
+                    byte_tables.append((tuple(byte_actions),
+                                        tuple(byte_rewards)))
+
+            tables[color][roll] = (onboard, bearoff_sources,
+                                   tuple(byte_tables))
+
+    return tables
+
+
+ACTION_TABLES = action_tables()
+
 
 class Board:
     """Defines a board."""
 
     def __init__(self):
-        self.__board = [Point('b', 2), Point(), Point(),
-                        Point(), Point(), Point('w', 5),
-                        Point(), Point('w', 3), Point(),
-                        Point(), Point(), Point('b', 5),
-                        Point('w', 5), Point(), Point(),
-                        Point(), Point('b', 3), Point(),
-                        Point('b', 5), Point(), Point(),
-                        Point(), Point(), Point('w', 2)]
-
-        self.__hit = {'w': 0, 'b': 0}
-        self.__bourne_off = {'w': 0, 'b': 0}
+        self.__points = array('b', INITIAL_POINTS)
+        self.__view = np.frombuffer(self.__points, dtype=np.int8)
+        self.__undo = []
+        self.__refresh()
+
+    def __getstate__(self):
+        # The NumPy view can not be pickled without losing its link to the
+        # array, so it is rebuilt when unpickling or copying.
+        return {'points': self.__points.tobytes(), 'undo': self.__undo}
+
+    def __setstate__(self, state):
+        self.__points = array('b')
+        self.__points.frombytes(state['points'])
+        self.__view = np.frombuffer(self.__points, dtype=np.int8)
+        self.__undo = list(state['undo'])
+        self.__refresh()
+
+    def __refresh(self):
+        """Recomputes the occupancy masks, totals, pips and home board counts
+        from the array."""
+
+        self.__occupied = {'w': 0, 'b': 0}
+        self.__blots = {'w': 0, 'b': 0}
+        self.__totals = {'w': 0, 'b': 0}
+        self.__pips = {'w': 0, 'b': 0}
+        self.__outside = {'w': 0, 'b': 0}
+        self.__hash = 0
+        self.__mirror_hash = 0
+        for slot, value in enumerate(self.__points):
+            self.__points[slot] = 0
+            self.__set(slot, value)
+
+    def __set(self, slot, value):
+        """Sets a slot of the array, updating everything derived from it."""
+
+        old = self.__points[slot]
+        self.__points[slot] = value
+        self.__hash ^= ZOBRIST[slot][old] ^ ZOBRIST[slot][value]
+        mirror = ZOBRIST[MIRROR_SLOTS[slot]]
+        self.__mirror_hash ^= mirror[-old] ^ mirror[-value]
+
+        w_delta = max(value, 0) - max(old, 0)
+        b_delta = max(-value, 0) - max(-old, 0)
+        if w_delta:
+            self.__pips['w'] += w_delta*W_PIPS[slot]
+            self.__outside['w'] += w_delta*W_OUTSIDE[slot]
+        if b_delta:
+            self.__pips['b'] += b_delta*B_PIPS[slot]
+            self.__outside['b'] += b_delta*B_OUTSIDE[slot]
+
+        if slot < 24:
+            self.__totals['w'] += w_delta
+            self.__totals['b'] += b_delta
+            bit = 1 << slot
+            if value > 0:
+                self.__occupied['w'] |= bit
+                self.__occupied['b'] &= ~bit
+            elif value < 0:
+                self.__occupied['b'] |= bit
+                self.__occupied['w'] &= ~bit
+            else:
+                self.__occupied['w'] &= ~bit
+                self.__occupied['b'] &= ~bit
+            if value == 1:
+                self.__blots['w'] |= bit
+            else:
+                self.__blots['w'] &= ~bit
+            if value == -1:
+                self.__blots['b'] |= bit
+            else:
+                self.__blots['b'] &= ~bit
+
+    def get_points(self):
+        """Returns the raw array of 28 signed slots. Indexing it is the fastest
+        way to read the board from Python; it must not be modified directly."""
+
+        return self.__points
+
+    def get_array(self):
+        """Returns a read-only NumPy int8 view of the 28 signed slots. The view
+        follows every update of the board without being rebuilt."""
+
+        view = self.__view.view()
+        view.flags.writeable = False
+        return view
 
     def get_board(self):
-        """Get method for the board."""
-
-        return self.__board
+        """Get method for the board as a list of 24 Points. The Points are
+        copies; modifying them does not modify the board."""
+
+        board = []
+        for value in self.__points[:24]:
+            if value > 0:
+                board.append(Point('w', value))
+            elif value < 0:
+                board.append(Point('b', -value))
+            else:
+                board.append(Point())
+        return board
 
     def set_board(self, board):
-        """Set method for the board."""
+        """Set method for the board from a list of 24 Points."""
+
+        for index, point in enumerate(board):
+            sign = SIGNS.get(point.get_color(), 0)
+            self.__points[index] = sign * point.get_count()
+        self.__refresh()
+
+    def get_color(self, point_index):
+        """Gets the color of the checkers in a point."""
+
+        value = self.__points[point_index]
+        if value > 0:
+            return 'w'
+        if value < 0:
+            return 'b'
+        return None
+
+    def get_count(self, point_index):
+        """Gets the number of checkers in a point."""
 
-        self.__board = board
+        return abs(self.__points[point_index])
+
+    def get_bar(self, color):
+        """Gets the number of checkers of a color on the bar."""
+
+        return abs(self.__points[BARS[color]])
+
+    def get_off(self, color):
+        """Gets the number of checkers of a color bourne off."""
+
+        return abs(self.__points[OFFS[color]])
 
     def get_hit(self):
         """Get method for the checkers hit."""
 
-        return self.__hit
+        return {'w': self.get_bar('w'), 'b': self.get_bar('b')}
 
     def set_hit(self, hit):
         """Set method for the checkers hit."""
 
-        self.__hit = hit
+        self.__set(W_BAR, hit['w'])
+        self.__set(B_BAR, -hit['b'])
 
     def get_bourne_off(self):
         """Get method for the checkers bourne off."""
 
-        return self.__hit
+        return {'w': self.get_off('w'), 'b': self.get_off('b')}
 
-    def set_bourne_off(self, hit):
+    def set_bourne_off(self, bourne_off):
         """Set method for the checkers bourne off."""
 
-        self.__hit = hit
+        self.__set(W_OFF, bourne_off['w'])
+        self.__set(B_OFF, -bourne_off['b'])
+
+    def get_occupied(self, color):
+        """Gets the mask of the points occupied by a color. Bit i is set when
+        point i holds at least one checker of the color."""
+
+        return self.__occupied[color]
+
+    def get_blots(self, color):
+        """Gets the mask of the points holding a single checker of a color."""
+
+        return self.__blots[color]
+
+    def get_total(self, color):
+        """Gets the number of checkers of a color on the points."""
+
+        return self.__totals[color]
+
+    def get_pips(self, color):
+        """Gets the pip count of a color."""
+
+        return self.__pips[color]
+
+    def can_bearoff(self, color):
+        """Returns if all the checkers of a color in play are in its home
+        board."""
+
+        return self.__outside[color] == 0
+
+    def get_winner(self):
+        """Returns the color that has no checkers left on the points or the bar,
+        or None if the game is not over."""
+
+        for color in ['w', 'b']:
+            if self.__totals[color] == 0 and self.__points[BARS[color]] == 0:
+                return color
+        return None
+
+    def get_hash(self, color=None):
+        """Returns the 64-bit Zobrist hash of the position. If the color to move
+        is given, it is included in the hash."""
+
+        if color == 'b':
+            return self.__hash ^ ZOBRIST_SIDE
+        return self.__hash
+
+    def get_canonical_hash(self, color):
+        """Returns the 64-bit Zobrist hash of the position seen by a color,
+        which for black is the hash of the mirror image of the board."""
+
+        if color == 'b':
+            return self.__mirror_hash
+        return self.__hash
+
+    def get_canonical_points(self, color):
+        """Returns the 28 signed slots of the position seen by a color. For
+        white it is the raw array, for black a new array of the mirror image of
+        the board."""
+
+        if color == 'b':
+            points = self.__points
+            return array('b', [-points[slot] for slot in MIRROR_SLOTS])
+        return self.__points
+
+    def is_over(self):
+        """Returns if the game is over or not."""
+
+        return self.get_winner() is not None
+
+    def get_actions(self, color, roll):
+        """Returns the actions a color can take with a single dice roll, and
+        the reward of each action, as two lists. A checker on the bar must
+        reenter before any other action can be taken."""
+
+        actions = []
+        rewards = []
+        opponent_occupied = self.__occupied[OPPONENTS[color]]
+        opponent_blots = self.__blots[OPPONENTS[color]]
+
+        if color == 'w':
+            if self.__points[W_BAR] > 0:
+                target = 24 - roll
+                if not (opponent_occupied >> target) & 1:
+                    actions.append(('reenter', target))
+                    rewards.append(roll)
+                elif (opponent_blots >> target) & 1:
+                    actions.append(('reenter_hit', target))
+                    rewards.append(24)
+                return actions, rewards
+
+            # The checkers of white move down the board, so a target mask is
+            # shifted up by the roll to line it up with its sources.
+            opponent_occupied <<= roll
+            opponent_blots <<= roll
+        else:
+            if self.__points[B_BAR] < 0:
+                target = roll - 1
+                if not (opponent_occupied >> target) & 1:
+                    actions.append(('reenter', target))
+                    rewards.append(roll)
+                elif (opponent_blots >> target) & 1:
+                    actions.append(('reenter_hit', target))
+                    rewards.append(24)
+                return actions, rewards
+
+            opponent_occupied >>= roll
+            opponent_blots >>= roll
+
+        sources = self.__occupied[color]
+        onboard, bearoff_sources, tables = ACTION_TABLES[color][roll]
+        moves = sources & onboard & ~opponent_occupied
+        hits = sources & opponent_blots
+        if self.__outside[color] == 0:
+            bearoffs = sources & bearoff_sources
+        else:
+            bearoffs = 0
+        for chunk in (0, 3, 6):
+            if moves:
+                action_table, reward_table = tables[chunk]
+                actions.extend(action_table[moves & 0xFF])
+                rewards.extend(reward_table[moves & 0xFF])
+                moves >>= 8
+            if hits:
+                action_table, reward_table = tables[chunk + 1]
+                actions.extend(action_table[hits & 0xFF])
+                rewards.extend(reward_table[hits & 0xFF])
+                hits >>= 8
+            if bearoffs:
+                action_table, reward_table = tables[chunk + 2]
+                actions.extend(action_table[bearoffs & 0xFF])
+                rewards.extend(reward_table[bearoffs & 0xFF])
+                bearoffs >>= 8
+
+        return actions, rewards
+
+    def make(self, color, action):
+        """Applies an action of a color and pushes it to the undo stack, so that
+        it can be taken back with unmake."""
+
+        if action[0] == 'move':
+            self.update_move(color, action[1], action[2])
+        elif action[0] == 'hit':
+            self.update_hit(color, action[1], action[2])
+        elif action[0] == 'bearoff':
+            self.update_bearoff(color, action[1])
+        elif action[0] == 'reenter':
+            self.update_reenter(color, action[1])
+        elif action[0] == 'reenter_hit':
+            self.update_reenterhit(color, action[1])
+        else:
+            raise ValueError('Unidentified action chosen')
+
+        self.__undo.append((color, action))
+
+    def unmake(self):
+        """Takes back the last action applied with make, putting back hit
+        checkers and bourne off checkers. Returns the color and the action."""
+
+        color, action = self.__undo.pop()
+        sign = SIGNS[color]
+        points = self.__points
+
+        if action[0] == 'move':
+            self.__set(action[2], points[action[2]] - sign)
+            self.__set(action[1], points[action[1]] + sign)
+        elif action[0] == 'hit':
+            opponent_bar = BARS[OPPONENTS[color]]
+            self.__set(opponent_bar, points[opponent_bar] + sign)
+            self.__set(action[2], -sign)
+            self.__set(action[1], points[action[1]] + sign)
+        elif action[0] == 'bearoff':
+            off = OFFS[color]
+            self.__set(off, points[off] - sign)
+            self.__set(action[1], points[action[1]] + sign)
+        elif action[0] == 'reenter':
+            bar = BARS[color]
+            self.__set(bar, points[bar] + sign)
+            self.__set(action[1], points[action[1]] - sign)
+        else:
+            bar = BARS[color]
+            opponent_bar = BARS[OPPONENTS[color]]
+            self.__set(bar, points[bar] + sign)
+            self.__set(opponent_bar, points[opponent_bar] + sign)
+            self.__set(action[1], -sign)
+
+        return color, action
+
+    def get_undo_depth(self):
+        """Returns the number of actions that can be taken back."""
+
+        return len(self.__undo)
+
+    def get_snapshot(self):
+        """Returns the position as a small immutable tuple, holding the bytes
+        of the array and everything derived from it, so that set_snapshot can
+        restore it without recomputing anything. Snapshots can be pickled."""
+
+        return (self.__points.tobytes(),
+                self.__occupied['w'], self.__occupied['b'],
+                self.__blots['w'], self.__blots['b'],
+                self.__totals['w'], self.__totals['b'],
+                self.__pips['w'], self.__pips['b'],
+                self.__outside['w'], self.__outside['b'],
+                self.__hash, self.__mirror_hash)
+
+    def set_snapshot(self, snapshot):
+        """Restores in place a position returned by get_snapshot. The actions
+        made before are forgotten, so they can no longer be taken back."""
+
+        (points, w_occupied, b_occupied, w_blots, b_blots, w_total, b_total,
+         w_pips, b_pips, w_outside, b_outside, self.__hash,
+         self.__mirror_hash) = snapshot
+        self.__points[:] = array('b', points)
+        self.__occupied = {'w': w_occupied, 'b': b_occupied}
+        self.__blots = {'w': w_blots, 'b': b_blots}
+        self.__totals = {'w': w_total, 'b': b_total}
+        self.__pips = {'w': w_pips, 'b': b_pips}
+        self.__outside = {'w': w_outside, 'b': b_outside}
+        self.__undo = []
+
+    def reset(self):
+        """Puts the checkers back to the starting position in place."""
+
+        self.set_snapshot(INITIAL_SNAPSHOT)
 
     def update_move(self, color, source_point_index, target_point_index):
         """Moves a single checker from one point to another. This action is only
         valid for moving to an empty point or a point already occupied by the
         player."""
 
-        source = self.__board[source_point_index]
-        target = self.__board[target_point_index]
-
-        if target.get_count() == 0:
-            target.add_firstchecker(color)
-        else:
-            target.add_checker()
-
-        source.remove_checker()
+        sign = SIGNS[color]
+        points = self.__points
+        self.__set(source_point_index, points[source_point_index] - sign)
+        self.__set(target_point_index, points[target_point_index] + sign)
 
     def update_hit(self, color, source_point_index, target_point_index):
         """Hits an opponent's checker. This action is only valid for hitting an
         opponent checker that is alone in a point."""
 
-        source = self.__board[source_point_index]
-        target = self.__board[target_point_index]
-
-        source.remove_checker()
-        target.add_firstchecker(color)
-        opponent = 'b' if color == 'w' else 'w'
-        self.__hit[opponent] += 1
+        sign = SIGNS[color]
+        points = self.__points
+        opponent_bar = BARS[OPPONENTS[color]]
+        self.__set(source_point_index, points[source_point_index] - sign)
+        self.__set(target_point_index, sign)
+        self.__set(opponent_bar, points[opponent_bar] - sign)
 
     def update_bearoff(self, color, source_point_index):
         """Bears a checker off the board."""
 
-        source = self.__board[source_point_index]
-
-        source.remove_checker()
-        self.__bourne_off[color] += 1
+        sign = SIGNS[color]
+        points = self.__points
+        off = OFFS[color]
+        self.__set(source_point_index, points[source_point_index] - sign)
+        self.__set(off, points[off] + sign)
 
     def update_reenter(self, color, target_index):
+        """Reenters a checker from the bar to an empty point or a point already
+        occupied by the player."""
 
-        target = self.__board[target_index]
-
-        if target.get_count() == 0:
-            target.add_firstchecker(color)
-        else:
-            target.add_checker()
-        self.__hit[color] -= 1
+        sign = SIGNS[color]
+        points = self.__points
+        bar = BARS[color]
+        self.__set(target_index, points[target_index] + sign)
+        self.__set(bar, points[bar] - sign)
 
     def update_reenterhit(self, color, target_index):
+        """Reenters a checker from the bar, hitting an opponent's checker that
+        is alone in the target point."""
+
+        sign = SIGNS[color]
+        points = self.__points
+        bar = BARS[color]
+        opponent_bar = BARS[OPPONENTS[color]]
+        self.__set(target_index, sign)
+        self.__set(opponent_bar, points[opponent_bar] - sign)
+        self.__set(bar, points[bar] - sign)
 
-        target = self.__board[target_index]
 
-        target.add_firstchecker(color)
-        opponent = 'b' if color == 'w' else 'w'
-        self.__hit[opponent] += 1
-        self.__hit[color] -= 1
+# The starting position, restored by Board.reset without recomputing it.
+INITIAL_SNAPSHOT = Board().get_snapshot()
 
 
 class Point:
     """Defines a point, which is a division of the board."""
 
     def __init__(self, color=None, count=0):
-        if count is 0:
+        if count == 0:
             assert color is None
 
         self.__count = count
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    This file contains the dice roller of the games. Each roller owns a NumPy
+    generator that can be seeded, and draws the dice in large blocks, handing
+    them out one roll at a time as Python ints.
+"""
+
+import numpy as np
+
+
+def spawn_seeds(seed, count):
+    """Returns count independent 32-bit seeds derived from a seed, for the
+    generators of a game that must not share the same stream. They are all
+    None if the seed is None."""
+
+    if seed is None:
+        return [None, ]*count
+
+    return [int(child.generate_state(1)[0])
+            for child in np.random.SeedSequence(seed).spawn(count)]
+
+
+class DiceRoller:
+    """Rolls the dice of a game from its own seedable generator. The same seed
+    gives the same rolls and the same random choices."""
+
+    def __init__(self, seed=None, block=1024):
+        self.__rng = np.random.RandomState(seed)
+        self.__block = block
+        self.__rolls = []
+        self.__roll_index = 0
+        self.__samples = []
+        self.__sample_index = 0
+
+    def seed(self, seed=None):
+        """Seeds the generator, dropping the dice drawn before."""
+
+        self.__rng.seed(seed)
+        self.__rolls = []
+        self.__roll_index = 0
+        self.__samples = []
+        self.__sample_index = 0
+
+        return [seed]
+
+    def roll_pair(self):
+        """Returns the two dice of a roll as a list."""
+
+        if self.__roll_index == len(self.__rolls):
+            self.__rolls = self.__rng.randint(1, 7, size=(self.__block, 2)).tolist()
+            self.__roll_index = 0
+        pair = self.__rolls[self.__roll_index]
+        self.__roll_index += 1
+
+        return list(pair)
+
+    def roll(self):
+        """Returns the dice to play for a roll: both dice, or four of them for
+        doubles."""
+
+        first, second = self.roll_pair()
+        if first == second:
+            return [first, ]*4
+        return [first, second]
+
+    def toss(self):
+        """Returns 1 if player 1 starts the game, 2 otherwise. Each player
+        rolls a single dice until they differ, and the higher one starts."""
+
+        first, second = self.roll_pair()
+        while first == second:
+            first, second = self.roll_pair()
+
+        return 1 if first > second else 2
+
+    def random(self):
+        """Returns a float uniformly drawn from [0, 1)."""
+
+        if self.__sample_index == len(self.__samples):
+            self.__samples = self.__rng.random_sample(self.__block).tolist()
+            self.__sample_index = 0
+        sample = self.__samples[self.__sample_index]
+        self.__sample_index += 1
+
+        return sample
+
+    def choice(self, sequence):
+        """Returns a uniformly random element of a non-empty sequence."""
+
+        return sequence[int(self.random()*len(sequence))]
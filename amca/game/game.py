@@ -12,18 +12,22 @@
     This file contains the classes required to play backgammon.
 """
 
-import random
 import copy
 
 import numpy as np
 from amca.game.board import Board
+from amca.game.dice import DiceRoller
+from amca.game.turns import get_turns
+
+
+DICE_ROLLER = DiceRoller()
 
 
 def roll_dice():
-    dice = [np.random.randint(1, 6), np.random.randint(1, 6)]
-    if dice[0] == dice[1]:
-        return [dice[0], ]*4
-    return dice
+    """Rolls the dice from the shared roller of the module. Games roll from
+    their own rollers."""
+
+    return DICE_ROLLER.roll()
 
 
 def all_possible_actions():
@@ -50,40 +54,113 @@ def all_possible_actions():
     return actions
 
 
+def action_indices(actions):
+    """Returns a dict mapping each action to its index in a list of actions.
+    Actions listed more than once map to their first index."""
+
+    indices = {}
+    for actionint, action in enumerate(actions):
+        if action not in indices:
+            indices[action] = actionint
+
+    return indices
+
+
+def mirror_action(action):
+    """Returns the action of the mirror image of the board, playing the same
+    checkers seen from the other side."""
+
+    if action[0] in ['move', 'hit']:
+        return (action[0], 23 - action[1], 23 - action[2])
+    return (action[0], 23 - action[1])
+
+
+def get_choices(valid_actions, their_rewards):
+    """Returns a dict mapping each valid action to the index of the dice that
+    plays it and its reward. When more than one dice can play an action, the
+    first one is used."""
+
+    choices = {}
+    for index, action_set in enumerate(valid_actions):
+        reward_set = their_rewards[index]
+        for action, reward in zip(action_set, reward_set):
+            if action not in choices:
+                choices[action] = (index, reward)
+
+    return choices
+
+
 ALL_ACTIONS = all_possible_actions()
+ACTION_INDEX = action_indices(ALL_ACTIONS)
+
+# Index of the mirror image of each action, at its first index. Mirroring maps
+# the actions onto themselves, so it also maps mirrored actions back.
+MIRROR_INDEX = np.array([ACTION_INDEX[mirror_action(action)]
+                         for action in ALL_ACTIONS])
+
+# Color and count of a point in the observation, indexed by its signed value.
+# Negative values index from the end, as in the Zobrist keys of the board.
+OBSERVATION_POINTS = np.zeros((31, 2), dtype=np.int64)
+for _count in range(1, 16):
+    OBSERVATION_POINTS[_count] = (1, _count)
+    OBSERVATION_POINTS[-_count] = (2, _count)
+
+# TD-Gammon units of a point, indexed by its signed value: 4 units for white
+# followed by 4 for black. The first three are set for at least 1, 2 and 3
+# checkers, and the fourth is half of the checkers beyond 3.
+TD_POINTS = np.zeros((31, 8), dtype=np.float32)
+for _count in range(1, 16):
+    _units = [1, _count >= 2, _count >= 3, max(_count - 3, 0)/2]
+    TD_POINTS[_count, :4] = _units
+    TD_POINTS[-_count, 4:] = _units
+
+# One-hot units of the two dice shown in the observation, 0 for no dice.
+TD_DICE = np.zeros((7, 7, 12), dtype=np.float32)
+for _first in range(1, 7):
+    TD_DICE[_first, :, _first - 1] = 1
+for _second in range(1, 7):
+    TD_DICE[:, _second, 5 + _second] = 1
+
+NUM_TD_FEATURES = 210
 
 
 class Game:
     """Player 1 is the priveleged player here. Player 2 is the player who is
     the opponent. The opponent can either be a random agent, a human, or a
-    policy agent."""
+    policy agent. With td_gammon, a policy opponent is shown the TD-Gammon
+    encoding of the board, as the player of a TD-Gammon environment is."""
 
-    def __init__(self, player1, player2):
+    def __init__(self, player1, player2, dice_roller=None, td_gammon=False):
         # Initialize game vars
         self.__gameboard = Board()
-        self.__w_hitted = 0
-        self.__b_hitted = 0
-        self.__w_bourne_off = 0
-        self.__b_bourne_off = 0
-        self.__w_canbearoff = False
-        self.__b_canbearoff = False
+        self.__array = self.__gameboard.get_array()
         self.__opponent = player2
+        self.__td_gammon = td_gammon
+        if dice_roller is None:
+            dice_roller = DiceRoller()
+        self.__dice_roller = dice_roller
+        self.reset()
+
+    def reset(self):
+        """Starts a new game in place, reusing the board."""
+
+        self.__gameboard.reset()
         self.__dice = []
+        self.__undo = []
 
         # The higher dice roll starts
-        w_toss = roll_dice()
-        b_toss = roll_dice()
-        while sum(w_toss) == sum(b_toss):
-            w_toss = roll_dice()
-            b_toss = roll_dice()
-
-        self.__dice = roll_dice()
-        if sum(w_toss) > sum(b_toss):
+        if self.__dice_roller.toss() == 1:
             self.__turn = 1
+            self.__dice = self.__dice_roller.roll()
         else:
             self.__turn = 2
             self.opponent_turn()
 
+    def seed(self, seed=None):
+        """Seeds the dice and the random choices of the game."""
+
+        return self.__dice_roller.seed(seed)
+
     def player_turn(self, actionint):
         """Takes an actionint from the Backgammon Environment, converts it to an
         action, processes the result of the action and returns the reward."""
@@ -94,7 +171,8 @@ class Game:
 
         # Case of no valid actions
         valid_actions, their_rewards = self.get_valid_actions()
-        if not any(valid_actions):
+        choices = get_choices(valid_actions, their_rewards)
+        if not choices:
             self.__turn = 2
             self.opponent_turn()
             reward = 0
@@ -102,81 +180,101 @@ class Game:
 
         action = self.get_action(actionint)
 
-        # Case of choosing valid action
-        for index, action_set in enumerate(valid_actions):
-            if action in action_set:
-                self.act(action)
-                del self.__dice[index]
-                if not self.__dice:
-                    self.__turn = 2
-                    self.opponent_turn()
-                reward = their_rewards[index][action_set.index(action)]
-                return reward
-
-        # Case of choosing invalid action
-        action = self.get_random_action(valid_actions)
-        for index, action_set in enumerate(valid_actions):
-            if action in action_set:
-                self.act(action)
-                del self.__dice[index]
-                if not self.__dice:
-                    self.__turn = 2
-                    self.opponent_turn()
-                reward = -10
-                return reward
-
-        raise ValueError('Unexpected error occured')
+        if action in choices:
+            # Case of choosing valid action
+            reward = choices[action][1]
+        else:
+            # Case of choosing invalid action
+            action = self.get_random_action(valid_actions)
+            reward = -10
+
+        self.act(action)
+        del self.__dice[choices[action][0]]
+        if not self.__dice:
+            self.__turn = 2
+            self.opponent_turn()
+        return reward
 
     def opponent_turn(self):
         """Manages the whole turn for the opponent."""
 
-        self.__dice = roll_dice()
+        self.__dice = self.__dice_roller.roll()
         while self.__dice:
             if self.get_done():
                 break
             self.play_opponent()
         self.__turn = 1
-        self.__dice = roll_dice()
+        self.__dice = self.__dice_roller.roll()
 
         return
 
     def play_opponent(self):
-        """Plays a single dice of the opponent."""
+        """Plays a single dice of the opponent. Models are trained as player 1,
+        so opponents whose canonical attribute is True, such as the policy
+        agents, are shown the board and the mask mirrored to their point of
+        view, and their action is mirrored back."""
 
         # Case of playing out of turn
         if self.__turn != 2:
             raise ValueError('Opponent playing out of turn!')
 
         # Case of no valid actions
-        valid_actions, _ = self.get_valid_actions()
-        if not any(valid_actions):
+        valid_actions, their_rewards = self.get_valid_actions()
+        choices = get_choices(valid_actions, their_rewards)
+        if not choices:
             self.__turn = 1
             self.__dice = []
             return
 
-        actionint = self.__opponent.make_decision(self.get_observation())
+        mask = np.zeros(len(ALL_ACTIONS), dtype=bool)
+        mask[[ACTION_INDEX[action] for action in choices]] = True
+        if getattr(self.__opponent, 'canonical', False):
+            canonical = np.zeros(len(ALL_ACTIONS), dtype=bool)
+            canonical[MIRROR_INDEX[mask]] = True
+            if self.__td_gammon:
+                observation = self.write_td_observation(
+                    np.zeros(NUM_TD_FEATURES, dtype=np.float32), canonical=True)
+            else:
+                observation = self.get_canonical_observation()
+            actionint = self.__opponent.make_decision(observation, mask=canonical)
+            actionint = self.get_real_action(actionint)
+        else:
+            actionint = self.__opponent.make_decision(self.get_observation(),
+                                                      mask=mask)
         action = self.get_action(actionint)
 
-        # Case of valid action chosen
-        for index, action_set in enumerate(valid_actions):
-            if action in action_set:
-                self.act(action)
-                del self.__dice[index]
-                return
-
         # Case of invalid action chosen
-        action = self.get_random_action(valid_actions)
-        for index, action_set in enumerate(valid_actions):
-            if action in action_set:
-                self.act(action)
-                del self.__dice[index]
-                return
+        if action not in choices:
+            action = self.get_random_action(valid_actions)
+
+        self.act(action)
+        del self.__dice[choices[action][0]]
+
+    def get_hash(self):
+        """Returns the 64-bit hash of the position and the side to move."""
+
+        if self.__turn == 1:
+            return self.__gameboard.get_hash('w')
+        return self.__gameboard.get_hash('b')
 
     def get_action(self, actionint):
         """Returns the action tuple associated with the actionint."""
 
         return ALL_ACTIONS[actionint]
 
+    def get_action_mask(self):
+        """Returns a boolean NumPy array over ALL_ACTIONS that is True for the
+        valid actions of any of the dice left. An action listed more than once
+        in ALL_ACTIONS is only marked at its first index."""
+
+        mask = np.zeros(len(ALL_ACTIONS), dtype=bool)
+        valid_actions, _ = self.get_valid_actions()
+        for action_set in valid_actions:
+            for action in action_set:
+                mask[ACTION_INDEX[action]] = True
+
+        return mask
+
     def get_valid_actions(self):
         """Returns two NUMPY array of NUMPY arrays as such:
 
@@ -197,72 +295,17 @@ class Game:
         """
         acts = []
         rews = []
-        points = self.__gameboard.get_board()
-        for roll in self.__dice:
-            w_indices = []
-            b_indices = []
-            empty_indices = []
-            index = 0
-            for point in points:
-                if point.get_color() == 'w':
-                    w_indices.append(index)
-                elif point.get_color() == 'b':
-                    b_indices.append(index)
-                else:
-                    empty_indices.append(index)
-                index = index+1
-
-            w_home_board = max(w_indices) < 6
-            b_home_board = min(b_indices) > 17
-            if w_home_board and (self.__w_hitted == 0):
-                self.__w_canbearoff = True
-            if b_home_board and (self.__b_hitted == 0):
-                self.__b_canbearoff = True
-
-            actions = []
-            rewards = []
-            if self.__turn == 1:
-                if self.__w_hitted > 0:
-                    if (24-roll) in (empty_indices + w_indices):
-                        actions.append(('reenter', 24-roll))
-                        rewards.append(roll)
-                    elif ((24-roll) in b_indices) and ((points[24-roll]).get_count() < 2):
-                        actions.append(('reenter_hit', 24-roll))
-                        rewards.append(24)
-
-                else:
-                    for index in w_indices:
-                        if (index-roll) in (w_indices + empty_indices):
-                            actions.append(('move', index, index - roll))
-                            rewards.append(roll)
-                        if ((index-roll) in b_indices) and ((points[index-roll]).get_count() < 2):
-                            actions.append(('hit', index, index - roll))
-                            rewards.append(index)
-                        if (self.__w_canbearoff) and (index < roll):
-                            actions.append(('bearoff', index))
-                            rewards.append(roll)
-
-            if self.__turn == 2:
-                if self.__b_hitted > 0:
-                    if (roll-1) in (empty_indices + b_indices):
-                        actions.append(('reenter', roll-1))
-                        rewards.append(roll)
-                    elif ((roll-1) in w_indices) and ((points[roll-1]).get_count() < 2):
-                        actions.append(('reenter_hit', roll-1))
-                        rewards.append(24)
-
-                else:
-                    for index in b_indices:
-                        if (index+roll) in (b_indices + empty_indices):
-                            actions.append(('move', index, index + roll))
-                            rewards.append(roll)
-                        if ((index+roll) in w_indices) and ((points[index+roll]).get_count() < 2):
-                            actions.append(('hit', index, index + roll))
-                            rewards.append(24-index)
-                        if (self.__b_canbearoff) and ((23-index) < roll):
-                            actions.append(('bearoff', index))
-                            rewards.append(roll)
+        if self.__turn == 1:
+            color = 'w'
+        else:
+            color = 'b'
 
+        # Doubles share the actions computed for the first of their dice.
+        computed = {}
+        for roll in self.__dice:
+            if roll not in computed:
+                computed[roll] = self.__gameboard.get_actions(color, roll)
+            actions, rewards = computed[roll]
             acts.append(actions)
             rews.append(rewards)
 
@@ -273,78 +316,221 @@ class Game:
         checkers hit and bourne off."""
 
         if self.__turn == 1:
-            if self.__w_hitted > 0:
-                if (action[0] == "reenter"):
-                    self.__w_hitted = self.__w_hitted - 1
-                    (self.__gameboard).update_reenter("w", action[1])
-                if (action[0] == "reenter_hit"):
-                    self.__w_hitted = self.__w_hitted - 1
-                    self.__b_hitted = self.__b_hitted + 1
-                    (self.__gameboard).update_reenterhit("w", action[1])
-            else:
-                if (action[0] == "move"):
-                    (self.__gameboard).update_move("w", action[1], action[2])
-                if (action[0] == "hit"):
-                    self.__b_hitted = self.__b_hitted + 1
-                    (self.__gameboard).update_hit("w", action[1], action[2])
-                if (action[0] == "bearoff"):
-                    (self.__gameboard).update_bearoff("w", action[1])
-
-        if self.__turn == 2:
-            if self.__b_hitted > 0:
-                if (action[0] == "reenter"):
-                    self.__b_hitted = self.__b_hitted - 1
-                    (self.__gameboard).update_reenter("b", action[1])
-                if (action[0] == "reenter_hit"):
-                    self.__w_hitted = self.__w_hitted + 1
-                    self.__b_hitted = self.__b_hitted - 1
-                    (self.__gameboard).update_reenterhit("b", action[1])
-            else:
-                if (action[0] == "move"):
-                    (self.__gameboard).update_move("b", action[1], action[2])
-                if (action[0] == "hit"):
-                    self.__w_hitted = self.__w_hitted + 1
-                    (self.__gameboard).update_hit("b", action[1], action[2])
-                if (action[0] == "bearoff"):
-                    (self.__gameboard).update_bearoff("b", action[1])
+            color = 'w'
+        else:
+            color = 'b'
+
+        if self.__gameboard.get_bar(color) > 0:
+            if (action[0] == "reenter"):
+                (self.__gameboard).update_reenter(color, action[1])
+            if (action[0] == "reenter_hit"):
+                (self.__gameboard).update_reenterhit(color, action[1])
+        else:
+            if (action[0] == "move"):
+                (self.__gameboard).update_move(color, action[1], action[2])
+            if (action[0] == "hit"):
+                (self.__gameboard).update_hit(color, action[1], action[2])
+            if (action[0] == "bearoff"):
+                (self.__gameboard).update_bearoff(color, action[1])
+
+    def get_dice(self):
+        """Returns the dice left to play in the current turn."""
+
+        return list(self.__dice)
+
+    def set_dice(self, dice):
+        """Sets the dice left to play in the current turn, e.g. to explore a
+        roll in a lookahead search."""
+
+        self.__dice = list(dice)
+
+    def get_turn(self):
+        """Returns 1 if it is the turn of player 1, 2 otherwise."""
+
+        return self.__turn
+
+    def make_move(self, action, roll=None):
+        """Plays a valid action for the side to move and consumes its dice,
+        without involving the opponent agent, so that it can be taken back with
+        unmake_move. The dice played can be given for actions that more than
+        one dice can play, such as bearing off. Once all the dice are played
+        the turn passes to the other side with no dice; set_dice gives it a
+        roll. An action of None passes the turn, for when no valid actions are
+        left."""
+
+        self.__undo.append((tuple(self.__dice), self.__turn, action))
+
+        if action is not None:
+            color = 'w' if self.__turn == 1 else 'b'
+            if roll is None:
+                roll = self.get_roll(action)
+            self.__gameboard.make(color, action)
+            self.__dice.remove(roll)
+
+        if action is None or not self.__dice:
+            self.__dice = []
+            self.__turn = 3 - self.__turn
+
+    def unmake_move(self):
+        """Takes back the last action played with make_move, restoring the
+        board, the dice and the turn. Returns the action."""
+
+        dice, turn, action = self.__undo.pop()
+        if action is not None:
+            self.__gameboard.unmake()
+        self.__dice = list(dice)
+        self.__turn = turn
+
+        return action
+
+    def get_snapshot(self):
+        """Returns the state of the game as a small immutable tuple of the
+        board snapshot, the dice left and the turn. It can be pickled and sent
+        to other processes, and does not hold the opponent."""
+
+        return (self.__gameboard.get_snapshot(), tuple(self.__dice), self.__turn)
+
+    def set_snapshot(self, snapshot):
+        """Restores in place a state returned by get_snapshot, e.g. to play a
+        rollout from the same position many times. The moves made before can
+        no longer be taken back."""
 
-        self.__w_bourne_off = self.__gameboard.get_bourne_off()['w']
-        self.__w_bourne_off = self.__gameboard.get_bourne_off()['b']
+        board, dice, self.__turn = snapshot
+        self.__gameboard.set_snapshot(board)
+        self.__dice = list(dice)
+        self.__undo = []
+
+    def get_turns(self):
+        """Returns the distinct full-turn moves of the side to move with the
+        dice left, as a list of (actions, rolls, afterstate) tuples."""
+
+        color = 'w' if self.__turn == 1 else 'b'
+
+        return get_turns(self.__gameboard, color, self.__dice)
+
+    def get_roll(self, action):
+        """Returns the dice of the current turn that a valid action plays.
+        Bearing off uses the lowest dice that is high enough."""
+
+        if action[0] in ['move', 'hit']:
+            return abs(action[1] - action[2])
+        if action[0] in ['reenter', 'reenter_hit']:
+            if self.__turn == 1:
+                return 24 - action[1]
+            return action[1] + 1
+
+        if self.__turn == 1:
+            distance = action[1] + 1
+        else:
+            distance = 24 - action[1]
+        return min(roll for roll in self.__dice if roll >= distance)
 
     def get_random_action(self, valid_actions):
-        first_choice = random.choice(valid_actions)
+        first_choice = self.__dice_roller.choice(valid_actions)
         while not first_choice:
-            first_choice = random.choice(valid_actions)
-        return random.choice(first_choice)
+            first_choice = self.__dice_roller.choice(valid_actions)
+        return self.__dice_roller.choice(first_choice)
 
     def get_observation(self):
-        statevec = []
-        if len(self.__dice) < 1:
-            statevec.append(0)
-            statevec.append(0)
-        elif len(self.__dice) < 2:
-            statevec.append(self.__dice[0])
-            statevec.append(0)
-        else:
-            statevec.append(self.__dice[0])
-            statevec.append(self.__dice[1])
-        statevec.append(self.__w_hitted)
-        statevec.append(self.__b_hitted)
-        statevec.append(self.__w_bourne_off)
-        statevec.append(self.__b_bourne_off)
-
-        for point in self.__gameboard.get_board():
-            if point.get_color() == 'w':
-                statevec.append(1)
-                statevec.append(point.get_count())
-            elif point.get_color() == 'b':
-                statevec.append(2)
-                statevec.append(point.get_count())
-            else:
-                statevec.append(0)
-                statevec.append(0)
+        return self.__get_observation(self.__gameboard.get_points())
+
+    def get_canonical_observation(self):
+        """Returns the observation of the board seen by the side to move: as
+        get_observation for player 1, of the mirror image of the board for
+        player 2, so that it sees its checkers as white."""
+
+        color = 'w' if self.__turn == 1 else 'b'
+
+        return self.__get_observation(self.__gameboard.get_canonical_points(color))
+
+    def get_canonical_action_mask(self):
+        """Returns the action mask of the side to move over the actions of the
+        board it sees, mirrored for player 2."""
+
+        mask = self.get_action_mask()
+        if self.__turn == 1:
+            return mask
+
+        canonical = np.zeros(len(ALL_ACTIONS), dtype=bool)
+        canonical[MIRROR_INDEX[mask]] = True
+        return canonical
+
+    def get_real_action(self, actionint):
+        """Returns the actionint on the board of an actionint chosen by the
+        side to move on the board it sees."""
+
+        if self.__turn == 1:
+            return actionint
+        return int(MIRROR_INDEX[actionint])
+
+    def __get_observation(self, points):
+        statevec = [0, ]*54
+        if self.__dice:
+            statevec[0] = self.__dice[0]
+        if len(self.__dice) > 1:
+            statevec[1] = self.__dice[1]
+
+        statevec[2] = points[24]
+        statevec[3] = -points[25]
+        statevec[4] = points[26]
+        statevec[5] = -points[27]
+        for index in range(24):
+            value = points[index]
+            if value > 0:
+                statevec[6+2*index] = 1
+                statevec[7+2*index] = value
+            elif value < 0:
+                statevec[6+2*index] = 2
+                statevec[7+2*index] = -value
         return statevec
 
+    def write_observation(self, out):
+        """Writes the observation of get_observation into the first 54
+        entries of a NumPy array, converting to its dtype, without building a
+        list."""
+
+        points = self.__array
+        dice = self.__dice
+        out[0] = dice[0] if dice else 0
+        out[1] = dice[1] if len(dice) > 1 else 0
+        out[2] = points[24]
+        out[3] = -points[25]
+        out[4] = points[26]
+        out[5] = -points[27]
+        out[6:54] = OBSERVATION_POINTS[points[:24]].ravel()
+
+        return out
+
+    def write_td_observation(self, out, canonical=False):
+        """Writes the TD-Gammon encoding of the game into the first 210
+        entries of a NumPy array:
+        1) 8 units for each of the 24 points, 4 for white and 4 for black,
+        2) the checkers on the bar of white and black, halved,
+        3) the checkers bourne off by white and black, over 15,
+        4) 2 units for the side to move, white then black,
+        5) 6 units for each of the two dice of the observation, one-hot.
+        If canonical, it is the encoding of the board seen by the side to
+        move, as in get_canonical_observation, with white to move."""
+
+        points = self.__array
+        turn = self.__turn
+        if canonical and turn == 2:
+            points = np.frombuffer(self.__gameboard.get_canonical_points('b'),
+                                   dtype=np.int8)
+            turn = 1
+        dice = self.__dice
+        out[0:192] = TD_POINTS[points[:24]].ravel()
+        out[192] = points[24]/2
+        out[193] = -points[25]/2
+        out[194] = points[26]/15
+        out[195] = -points[27]/15
+        out[196] = turn == 1
+        out[197] = turn == 2
+        out[198:210] = TD_DICE[dice[0] if dice else 0,
+                               dice[1] if len(dice) > 1 else 0]
+
+        return out
+
     def print_game(self):
         state = self.get_observation()
         max_picese_point = max(state)
@@ -405,14 +591,4 @@ class Game:
     def get_done(self):
         """Returns if the game is over or not."""
 
-        points = self.__gameboard.get_board()
-        i = 0
-        for color in ['w', 'b']:
-            i = 0
-            for point in points:
-                checkers = point.get_count()
-                if point.get_color() == color:
-                    i += checkers
-            if i < 1:
-                return True
-        return False
+        return self.__gameboard.is_over()
@@ -12,26 +12,114 @@
     This script contains the classes required to play backgammon.
 """
 
-import random
-
-from amca.game import Board
+from array import array
+
+from amca.game.board import Board, ZOBRIST_DICE, W_BAR, B_BAR, W_OFF, B_OFF
+from amca.game.game import mirror_action
+from amca.game.dice import DiceRoller
+
+
+WHITE_LETTERS = ("0", "1", "2", "3", "4", "5", "6",
+                 "7", "8", "9", "R", "U", "T", "V", "W", "Y", "Z")
+BLACK_LETTERS = ("0", "A", "B", "C", "D", "E", "F",
+                 "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q")
+WHITE_VALUES = {letter: value for value, letter in enumerate(WHITE_LETTERS) if value}
+BLACK_VALUES = {letter: value for value, letter in enumerate(BLACK_LETTERS) if value}
+
+# Bit of the dice roll in a state key, above the bytes of the 28 slots.
+DICE_SHIFT = 8 * 28
+
+# Negates the two's complement bytes of the slots.
+NEGATE = bytes((-value) & 0xff for value in range(256))
+
+
+def encode_state(points, adice):
+    """Returns the integer state key of 28 signed slots and a dice roll: the
+    roll followed by the byte of every slot, including the bars and the
+    bourne off checkers, in one integer."""
+
+    if not isinstance(points, bytes):
+        points = array('b', points).tobytes()
+
+    return (adice << DICE_SHIFT) | int.from_bytes(points, 'big')
+
+
+def decode_state(key):
+    """Returns the dice roll and the array of 28 signed slots of a state key,
+    e.g. to print it with debugging."""
+
+    points = (key & ((1 << DICE_SHIFT) - 1)).to_bytes(28, 'big')
+
+    return key >> DICE_SHIFT, array('b', points)
+
+
+def get_state3_key(state):
+    """Returns the state key of get_canonical_state_key for a state string of
+    get_state3, for migrating Q-tables keyed by those strings. The strings
+    do not tell the checkers on the bars from the bourne off ones, so the
+    migration is lossy: the missing checkers of a color are taken to be bourne
+    off if all of its other checkers are in its home board, and to be on the
+    bar otherwise, and the value of the string is only kept for that split."""
+
+    adice = int(state[0])
+    points = []
+    index = 1
+    while len(points) < 24 and index < len(state):
+        letter = state[index]
+        if letter in WHITE_VALUES:
+            # White points are followed by a "0" in the strings.
+            if state[index + 1:index + 2] != "0":
+                raise ValueError('Invalid state string: {}'.format(state))
+            points.append(WHITE_VALUES[letter])
+            index += 2
+        elif letter in BLACK_VALUES:
+            points.append(-BLACK_VALUES[letter])
+            index += 1
+        elif letter == "0":
+            points.append(0)
+            index += 1
+        else:
+            raise ValueError('Invalid state string: {}'.format(state))
+
+    white = 15 - sum(value for value in points if value > 0)
+    black = 15 + sum(value for value in points if value < 0)
+    if len(points) < 24 or index != len(state) or white < 0 or black < 0:
+        raise ValueError('Invalid state string: {}'.format(state))
+    slots = points + [0]*4
+    if all(value <= 0 for value in points[6:]):
+        slots[W_OFF] = white
+    else:
+        slots[W_BAR] = white
+    if all(value >= 0 for value in points[:18]):
+        slots[B_OFF] = -black
+    else:
+        slots[B_BAR] = -black
+
+    return encode_state(slots, adice)
 
 
 class SarsaGame:
     """Defines a backgammon game object."""
 
-    def __init__(self, w_player, b_player):
+    def __init__(self, w_player, b_player, dice_roller=None):
         self.__w_player = w_player
         self.__b_player = b_player
         self.__gameboard = Board()
         self.__dice = []
+        if dice_roller is None:
+            dice_roller = DiceRoller()
+        self.__dice_roller = dice_roller
+
+    def reset(self):
+        """Starts a new game in place, reusing the board."""
+
+        self.__gameboard.reset()
+        self.__dice = []
+
+    def seed(self, seed=None):
+        """Seeds the dice of the game."""
 
-        self.__w_hitted = 0
-        self.__b_hitted = 0
-        self.__w_bourne_off = 0
-        self.__b_bourne_off = 0
-        self.__w_canbearoff = False
-        self.__b_canbearoff = False
+        return self.__dice_roller.seed(seed)
 
     def get_player(self, color):
         """Returns the winning player based on the color."""
@@ -41,45 +129,129 @@ class SarsaGame:
         return self.__w_player if color == 'w' else self.__b_player
 
     def roll_dice(self):
-        self.__dice = [random.randint(1, 6), random.randint(1, 6)]
+        self.__dice = self.__dice_roller.roll_pair()
 
     def get_dice(self, diceid):
         return self.__dice[diceid]
 
+    def get_snapshot(self):
+        """Returns the state of the game as a small immutable tuple of the
+        board snapshot and the dice. It does not hold the players."""
+
+        return (self.__gameboard.get_snapshot(), tuple(self.__dice))
+
+    def set_snapshot(self, snapshot):
+        """Restores in place a state returned by get_snapshot."""
+
+        board, dice = snapshot
+        self.__gameboard.set_snapshot(board)
+        self.__dice = list(dice)
+
     def letterx(self, playerid, x):
-        white_indices = ["0", "1", "2", "3", "4", "5", "6",
-                         "7", "8", "9", "R", "U", "T", "V", "W", "Y", "Z"]
-        black_indices = ["0", "A", "B", "C", "D", "E", "F",
-                         "G", "H", "I", "J", "K", "L", "M", "N", "O", "P", "Q"]
         if playerid == "w":
-            a = white_indices[x]
+            a = WHITE_LETTERS[x]
         elif playerid == "b":
-            a = black_indices[x]
+            a = BLACK_LETTERS[x]
         return a
 
     def get_state(self):
         statevec = []
 
-        for point in self.__gameboard.get_board():
-            if point.get_color() == 'w':
-                statevec.append(point.get_count())
-            if point.get_color() == 'b':
-                statevec.append(16+point.get_count())
+        for value in self.__gameboard.get_points()[:24]:
+            if value > 0:
+                statevec.append(value)
+            if value < 0:
+                statevec.append(16-value)
             else:
                 statevec.append(0)
         return statevec
 
     def get_state3(self, adice):
-        statestr = str(adice)
+        return self.__get_state3(self.__gameboard.get_points(), adice)
+
+    def get_canonical_state(self, color, adice):
+        """Returns the state string of get_state3 for the board seen by a
+        color, as given by get_color. It is the same for white, and for black
+        it is the state of the mirror image of the board, so that an agent
+        trained as white can also play black. The SARSA scripts always train
+        and play the agent as white, so this does not make their tables any
+        smaller."""
+
+        points = self.__gameboard.get_canonical_points(color)
+
+        return self.__get_state3(points, adice)
+
+    def get_state_key(self, adice):
+        """Returns the integer state key of the board and a dice roll. It is
+        decoded by decode_state, and unlike get_state3 it also tells the bars
+        and the bourne off checkers apart."""
+
+        return encode_state(self.__gameboard.get_points().tobytes(), adice)
+
+    def get_canonical_state_key(self, color, adice):
+        """Returns the state key of get_state_key for the board seen by a
+        color, mirrored for black like get_canonical_state. It is the state
+        key of the Q-tables of the SARSA agents, the same as get_state_key for
+        white, the color they are trained as."""
+
+        points = self.__gameboard.get_points().tobytes()
+        if color == 'b':
+            points = (points[23::-1] + points[B_BAR:B_BAR+1] + points[W_BAR:W_BAR+1] +
+                      points[B_OFF:B_OFF+1] + points[W_OFF:W_OFF+1]).translate(NEGATE)
+
+        return encode_state(points, adice)
+
+    def get_canonical_state_hash(self, color, adice):
+        """Returns the hash of get_state_hash for the board seen by a
+        color."""
+
+        return self.__gameboard.get_canonical_hash(color) ^ ZOBRIST_DICE[adice]
+
+    def get_canonical_actions(self, color, roll):
+        """Returns the actions of get_actions as seen by a color, mirrored
+        for black, and their rewards. update_canonical_board plays them."""
+
+        actions, rewards = self.__get_actions(color, roll)
+        if color == 'b' and actions[0][0] != "Nomove":
+            actions = [mirror_action(action) for action in actions]
+
+        return actions, rewards
 
-        for point in self.__gameboard.get_board():
-            if point.get_color() == 'w':
-                statestr += self.letterx("w", point.get_count())
-            if point.get_color() == 'b':
-                statestr += self.letterx("b", point.get_count())
+    def update_canonical_board(self, color, action):
+        """Plays an action of get_canonical_actions."""
+
+        if color == 'b' and action[0] != "Nomove":
+            action = mirror_action(action)
+        self.__update(color, action)
+
+    def get_color(self, player):
+        """Returns the color of a player, 'w' or 'b', for the canonical
+        methods. Players resolve it once per game instead of every move."""
+
+        if player == self.__w_player:
+            return 'w'
+        if player == self.__b_player:
+            return 'b'
+        raise ValueError('Unknown player')
+
+    def __get_state3(self, points, adice):
+        letters = [str(adice)]
+
+        for value in points[:24]:
+            if value > 0:
+                letters.append(WHITE_LETTERS[value])
+            if value < 0:
+                letters.append(BLACK_LETTERS[-value])
             else:
-                statestr += "0"
-        return statestr
+                letters.append("0")
+        return ''.join(letters)
+
+    def get_state_hash(self, adice):
+        """Returns the 64-bit hash of the board and a dice roll. It identifies
+        the same states as get_state3, and also tells bars and bourne off
+        checkers apart, without building a string."""
+
+        return self.__gameboard.get_hash() ^ ZOBRIST_DICE[adice]
 
     def update_board(self, player, action):
         """Given a tuple of dice rolls, return the set of possible moves.
@@ -97,43 +269,23 @@ class SarsaGame:
                      your home board."""
 
         if player == self.__w_player:
-            if self.__w_hitted > 0:
-                if (action[0] == "reenter"):
-                    self.__w_hitted = self.__w_hitted - 1
-                    (self.__gameboard).update_reenter("w", action[1])
-                if (action[0] == "reenter_hit"):
-                    self.__w_hitted = self.__w_hitted - 1
-                    self.__b_hitted = self.__b_hitted + 1
-                    (self.__gameboard).update_reenterhit("w", action[1])
-            else:
-                if (action[0] == "move"):
-                    (self.__gameboard).update_move("w", action[1], action[2])
-                if (action[0] == "hit"):
-                    self.__b_hitted = self.__b_hitted + 1
-                    (self.__gameboard).update_hit("w", action[1], action[2])
-                if (action[0] == "bearoff"):
-                    (self.__gameboard).update_bearoff("w", action[1])
-
-        if player == self.__b_player:
-            if self.__b_hitted > 0:
-                if (action[0] == "reenter"):
-                    self.__b_hitted = self.__b_hitted - 1
-                    (self.__gameboard).update_reenter("b", action[1])
-                if (action[0] == "reenter_hit"):
-                    self.__w_hitted = self.__w_hitted + 1
-                    self.__b_hitted = self.__b_hitted - 1
-                    (self.__gameboard).update_reenterhit("b", action[1])
-            else:
-                if (action[0] == "move"):
-                    (self.__gameboard).update_move("b", action[1], action[2])
-                if (action[0] == "hit"):
-                    self.__w_hitted = self.__w_hitted + 1
-                    (self.__gameboard).update_hit("b", action[1], action[2])
-                if (action[0] == "bearoff"):
-                    (self.__gameboard).update_bearoff("b", action[1])
-
-        self.__w_bourne_off = self.__gameboard.get_bourne_off()['w']
-        self.__w_bourne_off = self.__gameboard.get_bourne_off()['b']
+            self.__update('w', action)
+        elif player == self.__b_player:
+            self.__update('b', action)
+
+    def __update(self, color, action):
+        if self.__gameboard.get_bar(color) > 0:
+            if (action[0] == "reenter"):
+                (self.__gameboard).update_reenter(color, action[1])
+            if (action[0] == "reenter_hit"):
+                (self.__gameboard).update_reenterhit(color, action[1])
+        else:
+            if (action[0] == "move"):
+                (self.__gameboard).update_move(color, action[1], action[2])
+            if (action[0] == "hit"):
+                (self.__gameboard).update_hit(color, action[1], action[2])
+            if (action[0] == "bearoff"):
+                (self.__gameboard).update_bearoff(color, action[1])
 
     def get_actions(self, player, roll):
         """Given a tuple of dice rolls, return the set of possible moves.
@@ -150,75 +302,14 @@ class SarsaGame:
                      the dice after all of your checkers have been brought into
                      your home board."""
 
-        points = self.__gameboard.get_board()
-
-        w_indices = []
-        b_indices = []
-        empty_indices = []
-        index = 0
-        for point in points:
-            if point.get_color() == 'w':
-                w_indices.append(index)
-            elif point.get_color() == 'b':
-                b_indices.append(index)
-            else:
-                empty_indices.append(index)
-            index = index+1
-
-        w_home_board = max(w_indices) < 6
-        b_home_board = min(b_indices) > 17
-        if w_home_board and (self.__w_hitted == 0):
-            self.__w_canbearoff = True
-        if b_home_board and (self.__b_hitted == 0):
-            self.__b_canbearoff = True
-
-        actions = []
-        rewards = []
         if player == self.__w_player:
-            if self.__w_hitted > 0:
-                if (24-roll) in empty_indices or w_indices:
-                    actions.append(('reenter', 24-roll))
-                    rewards.append(roll)
-                elif ((24-roll) in b_indices) and ((points[24-roll]).get_count() < 2):
-                    actions.append(('reenter_hit', 24-roll))
-                    rewards.append(24)
-
-                if len(actions) < 1:
-                    return [("Nomove", 0, 0)], [0]
-                return actions, rewards
-
-            for index in w_indices:
-                if (index-roll) in (w_indices + empty_indices):
-                    actions.append(('move', index, index - roll))
-                    rewards.append(roll)
-                if ((index-roll) in b_indices) and ((points[index-roll]).get_count() < 2):
-                    actions.append(('hit', index, index - roll))
-                    rewards.append(index)
-                if (self.__w_canbearoff) and (index < roll):
-                    actions.append(('bearoff', index))
-                    rewards.append(roll)
-
+            return self.__get_actions('w', roll)
         if player == self.__b_player:
-            if self.__b_hitted > 0:
-                if (roll-1) in empty_indices or b_indices:
-                    actions.append(('reenter', roll-1))
-                    rewards.append(roll)
-                elif ((roll-1) in w_indices) and ((points[roll-1]).get_count() < 2):
-                    actions.append(('reenter_hit', roll-1))
-                    rewards.append(24)
-                return actions, rewards
-
-            for index in b_indices:
-                if (index+roll) in (b_indices + empty_indices):
-                    actions.append(('move', index, index + roll))
-                    rewards.append(roll)
-                if ((index+roll) in w_indices) and ((points[index+roll]).get_count() < 2):
-                    actions.append(('hit', index, index + roll))
-                    rewards.append(24-index)
-                if (self.__b_canbearoff) and ((23-index) < roll):
-                    actions.append(('bearoff', index))
-                    rewards.append(roll)
+            return self.__get_actions('b', roll)
+        return [("Nomove", 0, 0)], [0]
 
+    def __get_actions(self, color, roll):
+        actions, rewards = self.__gameboard.get_actions(color, roll)
         if len(actions) < 1:
             return [("Nomove", 0, 0)], [0]
         return actions, rewards
@@ -227,55 +318,36 @@ class SarsaGame:
         """Returns a tuple of which the first element is a boolean of the game
         being over or not and the second element is the winner."""
 
-        points = self.__gameboard.get_board()
-
-        for color in ['w', 'b']:
-            i = 0
-            for point in points:
-                checkers = point.get_count()
-                if point.get_color() == color:
-                    i += checkers
-            if i < 1:
-                return True
-
-        return False
+        return self.is_over2()[0]
 
     def is_over2(self):
         """Returns a tuple of which the first element is a boolean of the game
         being over or not and the second element is the winner."""
 
-        points = self.__gameboard.get_board()
-        i = 0
-        for color in ['w', 'b']:
-            i = 0
-            for point in points:
-                checkers = point.get_count()
-                if point.get_color() == color:
-                    i += checkers
-            if i < 1:
-                return (True, self.get_player(color))
+        winner = self.__gameboard.get_winner()
+        if winner is not None:
+            return (True, self.get_player(winner))
 
         return (False, None)
 
     def get_observation(self):
-        statevec = []
-        statevec.append(self.__dice[0])
-        statevec.append(self.__dice[1])
-        statevec.append(self.__w_hitted)
-        statevec.append(self.__b_hitted)
-        statevec.append(self.__w_bourne_off)
-        statevec.append(self.__b_bourne_off)
-
-        for point in self.__gameboard.get_board():
-            if point.get_color() == 'w':
-                statevec.append(1)
-                statevec.append(point.get_count())
-            elif point.get_color() == 'b':
-                statevec.append(2)
-                statevec.append(point.get_count())
-            else:
-                statevec.append(0)
-                statevec.append(0)
+        statevec = [0, ]*54
+        statevec[0] = self.__dice[0]
+        statevec[1] = self.__dice[1]
+
+        points = self.__gameboard.get_points()
+        statevec[2] = points[24]
+        statevec[3] = -points[25]
+        statevec[4] = points[26]
+        statevec[5] = -points[27]
+        for index in range(24):
+            value = points[index]
+            if value > 0:
+                statevec[6+2*index] = 1
+                statevec[7+2*index] = value
+            elif value < 0:
+                statevec[6+2*index] = 2
+                statevec[7+2*index] = -value
         return statevec
 
     def render(self, mode='human'):
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    This file generates the full-turn moves of a roll. A full-turn move is the
+    sequence of single dice actions a color plays in a turn, and its afterstate
+    is the position it leads to. Sequences leading to the same position are
+    returned once.
+"""
+
+
+def get_turns(board, color, dice):
+    """Returns the distinct full-turn moves of a color for the dice left in a
+    turn, as a list of (actions, rolls, afterstate) tuples. The actions are a
+    tuple of single dice actions, the rolls are the dice they play in the same
+    order, and the afterstate is the bytes of the 28 signed slots of the board
+    after playing them.
+
+    The rules of the game are followed: as many dice as possible must be
+    played, and when only one of two different dice can be played it must be
+    the higher one. If no dice can be played the only full-turn move is the
+    empty one. The board is left as it was given."""
+
+    dice = tuple(dice)
+    if len(set(dice)) < 2:
+        orders = [dice]
+    else:
+        orders = [dice, dice[::-1]]
+
+    found = {}
+    visited = set()
+    best = [(-1, -1)]
+    for order in orders:
+        _search(board, color, order, (), (), found, visited, best)
+
+    return list(found.values())
+
+
+def _search(board, color, rolls, actions, played, found, visited, best):
+    """Plays out the remaining rolls depth first, recording the afterstates of
+    the sequences that play the most dice, and then the most pips."""
+
+    key = (board.get_hash(), rolls)
+    if key in visited:
+        return
+    visited.add(key)
+
+    valid_actions = []
+    if rolls and not board.is_over():
+        valid_actions, _ = board.get_actions(color, rolls[0])
+
+    if not valid_actions:
+        score = (len(actions), sum(played))
+        if score < best[0]:
+            return
+        if score > best[0]:
+            best[0] = score
+            found.clear()
+        position = board.get_hash()
+        if position not in found:
+            found[position] = (actions, played, board.get_points().tobytes())
+        return
+
+    for action in valid_actions:
+        board.make(color, action)
+        _search(board, color, rolls[1:], actions + (action, ),
+                played + (rolls[0], ), found, visited, best)
+        board.unmake()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    This script exports the policy of a deep RL trained model to a .npz file,
+    which PolicyAgent and play.py evaluate with NumPy only.
+"""
+
+import argparse
+import os
+
+from amca.agents.numpy_policy import export_policy
+from amca.agents.registry import get_model
+
+if __name__ == "__main__":
+    PARSER = argparse.ArgumentParser(description='Export a policy to NumPy')
+    PARSER.add_argument('--algorithm', '-a',
+                        help='Algorithm used to train the model.',
+                        default='PPO',
+                        type=str)
+    PARSER.add_argument('--model', '-m',
+                        help='Path to model',
+                        default='amca/models/amca.pkl',
+                        type=str)
+    PARSER.add_argument('--output', '-o',
+                        help='Path to the exported policy. Defaults to the model path with a .npz extension.',
+                        default='None',
+                        type=str)
+
+    ARGS = PARSER.parse_args()
+
+    output = ARGS.output
+    if output == 'None':
+        output = os.path.splitext(ARGS.model)[0] + '.npz'
+
+    export_policy(get_model(ARGS.algorithm, ARGS.model), output)
+    print('Exported {} to {}'.format(ARGS.model, output))
@@ -15,9 +15,10 @@
 import argparse
 
 import gym
-from stable_baselines import A2C, ACER, ACKTR, DDPG, DQN, GAIL, PPO2, TRPO, SAC
 
 import amca
+from amca.agents.numpy_policy import NumpyPolicy
+from amca.agents.registry import get_algorithm, get_model
 
 if __name__ == "__main__":
     PARSER = argparse.ArgumentParser(description='Train an agent using RL')
@@ -29,35 +30,37 @@ if __name__ == "__main__":
                         help='Path to model',
                         default='amca/models/amca.pkl',
                         type=str)
+    PARSER.add_argument('--mask', '-k',
+                        help='Whether the model was trained with masking.',
+                        default=0,
+                        type=int)
+    PARSER.add_argument('--td', '-f',
+                        help='Whether the model was trained with the TD-Gammon encoding.',
+                        default=0,
+                        type=int)
 
     ARGS = PARSER.parse_args()
 
-    if ARGS.algorithm.lower() == 'a2c':
-        algorithm = A2C
-    elif ARGS.algorithm.lower() == 'acer':
-        algorithm = ACER
-    elif ARGS.algorithm.lower() == 'acktr':
-        algorithm = ACKTR
-    elif ARGS.algorithm.lower() == 'ddpg':
-        algorithm = DDPG
-    elif ARGS.algorithm.lower() == 'dqn':
-        algorithm = DQN
-    elif ARGS.algorithm.lower() == 'gail':
-        algorithm = GAIL
-    elif ARGS.algorithm.lower() == 'ppo':
-        algorithm = PPO2
-    elif ARGS.algorithm.lower() == 'sac':
-        algorithm = SAC
-    elif ARGS.algorithm.lower() == 'trpo':
-        algorithm = TRPO
+    # Policies exported to .npz are played with NumPy only, without importing
+    # stable_baselines and TensorFlow.
+    if ARGS.model.endswith('.npz'):
+        model = NumpyPolicy(ARGS.model)
+        continuous = False
     else:
-        raise ValueError('Unidentified algorithm chosen')
+        from stable_baselines import DDPG, GAIL, SAC
+        model = get_model(ARGS.algorithm, ARGS.model)
+        continuous = get_algorithm(ARGS.algorithm) in [DDPG, GAIL, SAC]
 
-    if algorithm in [DDPG, GAIL, SAC]:
+    if continuous:
         env = gym.make('BackgammonHumanContinuousEnv-v0')
+    elif ARGS.td and ARGS.mask:
+        env = gym.make('BackgammonHumanMaskedTDEnv-v0')
+    elif ARGS.td:
+        env = gym.make('BackgammonHumanTDEnv-v0')
+    elif ARGS.mask:
+        env = gym.make('BackgammonHumanMaskedEnv-v0')
     else:
         env = gym.make('BackgammonHumanEnv-v0')
-    model = algorithm.load(ARGS.model)
 
     obs = env.reset()
     while True:
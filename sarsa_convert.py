@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    This script converts a pickled SARSA agent into a Q-table file, which
+    sarsa_play.py opens at once with mmap instead of unpickling it.
+"""
+
+import argparse
+import os
+
+from amca.agents.sarsa import load_agent
+
+if __name__ == "__main__":
+    PARSER = argparse.ArgumentParser(description='Convert a SARSA agent')
+    PARSER.add_argument('--name', '-n',
+                        help='Name of the pickled agent to convert.',
+                        default='amca/models/sarsa-vs_random-1M.pkl',
+                        type=str)
+    PARSER.add_argument('--output', '-o',
+                        help='Path to the Q-table file. Defaults to the agent path with a .qtable extension.',
+                        default='None',
+                        type=str)
+
+    ARGS = PARSER.parse_args()
+
+    output = ARGS.output
+    if output == 'None':
+        output = os.path.splitext(ARGS.name)[0] + '.qtable'
+
+    agent = load_agent(ARGS.name, mmap=False)
+    agent.save(output)
+    print('Converted {} with {} entries to {}'.format(ARGS.name, len(agent.q), output))
@@ -13,9 +13,9 @@
 """
 
 import argparse
-import pickle
 
 from amca.game import SarsaGame
+from amca.agents.sarsa import load_agent
 
 if __name__ == "__main__":
     PARSER = argparse.ArgumentParser(description='Train an agent using RL')
@@ -29,36 +29,35 @@ if __name__ == "__main__":
 
     ARGS = PARSER.parse_args()
 
-    filename = ARGS.name
-    infile = open(filename, 'rb')
-    agent = pickle.load(infile)
-    infile.close()
+    # Q-table files are mapped, so only the states visited are read.
+    agent = load_agent(ARGS.name)
 
     # TODO Make human player 1
     opponent = 'human'
     gamei = SarsaGame(agent, opponent)
+    color = gamei.get_color(agent)
     num_move = 0
 
     for _ in range(int(ARGS.games)):
         while (not gamei.is_over()):
 
             gamei.roll_dice()
-            curstate = gamei.get_state3(gamei.get_dice(0))
-            possible_actions, their_rewards = gamei.get_actions(
-                agent, gamei.get_dice(0))
+            curstate = gamei.get_canonical_state_key(color, gamei.get_dice(0))
+            possible_actions, their_rewards = gamei.get_canonical_actions(
+                color, gamei.get_dice(0))
             curaction = agent.playAction(curstate, possible_actions)
-            gamei.update_board(agent, curaction)
+            gamei.update_canonical_board(color, curaction)
             print("Computer Turn, dices: " + str(gamei.get_dice(0)) +
                   " " + str(gamei.get_dice(1)))
             print("Computer played: ")
             print(curaction)
 
             if not gamei.is_over():
-                nextstate = gamei.get_state3(gamei.get_dice(1))
-                possible_actions, their_rewards = gamei.get_actions(
-                    agent, gamei.get_dice(1))
+                nextstate = gamei.get_canonical_state_key(color, gamei.get_dice(1))
+                possible_actions, their_rewards = gamei.get_canonical_actions(
+                    color, gamei.get_dice(1))
                 nextaction = agent.playAction(curstate, possible_actions)
-                gamei.update_board(agent, nextaction)
+                gamei.update_canonical_board(color, nextaction)
                 print("Computer played: ")
                 print(nextaction)
             if not gamei.is_over():
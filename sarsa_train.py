@@ -13,35 +13,47 @@
 """
 
 import argparse
+import multiprocessing
 import pickle
+import random
 
-from amca.game import SarsaGame
+from amca.game import SarsaGame, DiceRoller
+from amca.game.dice import spawn_seeds
 from amca.agents import SarsaAgent, RandomSarsaAgent
+from amca.agents.qtable import QTable, is_table_file
+from amca.agents.sarsa import load_agent
 
 
-def train(agent_train, opponent, maxmove):
-    gamei = SarsaGame(agent_train, opponent)
+def train(agent_train, opponent, maxmove, gamei=None):
+    """Plays a game of the agent against the opponent, learning from it. A
+    SarsaGame of the two given as gamei is reset and reused, with its dice."""
+
+    if gamei is None:
+        gamei = SarsaGame(agent_train, opponent)
+    else:
+        gamei.reset()
+    color = gamei.get_color(agent_train)
     num_move = 0
     gamei.roll_dice()
     while (num_move < maxmove) and (not gamei.is_over()):
 
         # Agent turn
         if not gamei.is_over():
-            curstate = gamei.get_state3(gamei.get_dice(0))
-            possible_actions, their_rewards = gamei.get_actions(
-                agent_train, gamei.get_dice(0))
+            curstate = gamei.get_canonical_state_key(color, gamei.get_dice(0))
+            possible_actions, their_rewards = gamei.get_canonical_actions(
+                color, gamei.get_dice(0))
             curaction, action_index = agent_train.chooseAction(
                 curstate, possible_actions)
-            gamei.update_board(agent_train, curaction)
+            gamei.update_canonical_board(color, curaction)
             reward = their_rewards[action_index]
-            nextstate = gamei.get_state3(gamei.get_dice(1))
+            nextstate = gamei.get_canonical_state_key(color, gamei.get_dice(1))
         if not gamei.is_over():
-            curstate = gamei.get_state3(gamei.get_dice(1))
-            possible_actions, their_rewards = gamei.get_actions(
-                agent_train, gamei.get_dice(1))
+            curstate = gamei.get_canonical_state_key(color, gamei.get_dice(1))
+            possible_actions, their_rewards = gamei.get_canonical_actions(
+                color, gamei.get_dice(1))
             nextaction, action_index = agent_train.chooseAction(
                 curstate, possible_actions)
-            gamei.update_board(agent_train, nextaction)
+            gamei.update_canonical_board(color, nextaction)
             agent_train.learn(curstate, curaction,
                               reward, nextstate, nextaction)
             reward = their_rewards[action_index]
@@ -57,7 +69,7 @@ def train(agent_train, opponent, maxmove):
                         nextstate, possible_actions)
                     gamei.update_board(opponent, oppaction)
             gamei.roll_dice()
-            nextstate = gamei.get_state3(gamei.get_dice(0))
+            nextstate = gamei.get_canonical_state_key(color, gamei.get_dice(0))
             agent_train.learn(curstate, curaction,
                               reward, nextstate, nextaction)
 
@@ -66,6 +78,104 @@ def train(agent_train, opponent, maxmove):
     return agent_train
 
 
+def train_games(agent, games, maxmove, seed=None, verbose=0):
+    """Trains the agent for a number of games against a random opponent, in
+    one game reset between games. The same seed plays the same games."""
+
+    random_seed, dice_seed = spawn_seeds(seed, 2)
+    random.seed(random_seed)
+    opponent = RandomSarsaAgent('opponent')
+    gamei = SarsaGame(agent, opponent, DiceRoller(dice_seed))
+    for i in range(games):
+        if verbose:
+            print('Completed {} games'.format(i))
+        try:
+            agent = train(agent, opponent, maxmove, gamei)
+        except:
+            pass
+
+    return agent
+
+
+def train_worker(agent, updates, max_bytes, games, maxmove, seed):
+    """Stores the merged updates of the last round into the Q-table of a
+    worker, trains it for a number of games and returns the keys, values and
+    visits of the pairs it updated."""
+
+    agent.q.update(*updates)
+    # The table is kept within the memory budget of the merged one between
+    # rounds, evicting by the visits of the last round, but not during them,
+    # so that no update of the round is lost.
+    agent.q.set_max_bytes(max_bytes)
+    agent.q.set_max_bytes(None)
+    agent.q.reset_visits()
+    agent = train_games(agent, games, maxmove, seed)
+
+    return agent.q.get_visited()
+
+
+def run_worker(agent, connection):
+    """Runs the rounds of a worker on its own copy of the agent, received
+    once, until it is sent None."""
+
+    max_bytes = agent.q.get_max_bytes()
+    while True:
+        task = connection.recv()
+        if task is None:
+            break
+        connection.send(train_worker(agent, task[0], max_bytes, *task[1:]))
+    connection.close()
+
+
+def train_parallel(agent, processes, games, sync, maxmove, verbose):
+    """Trains the agent in a number of worker processes, each playing sync
+    games on its own copy of the Q-table before the updates of all the workers
+    are merged into the table. A pair updated by several workers gets the
+    average of their values, weighted by the number of times each updated it.
+
+    The workers keep their copies between rounds, and are only sent the
+    merged updates of the last round, which bring them back to the values of
+    the merged table."""
+
+    connections = []
+    workers = []
+    for _ in range(processes):
+        parent, child = multiprocessing.Pipe()
+        worker = multiprocessing.Process(target=run_worker, args=(agent, child))
+        worker.start()
+        child.close()
+        connections.append(parent)
+        workers.append(worker)
+
+    try:
+        updates = QTable().get_arrays()
+        completed = 0
+        while completed < games:
+            rounds = [max(0, min(sync, games - completed - i*sync))
+                      for i in range(processes)]
+            # Workers without games left still store the updates.
+            for connection, count in zip(connections, rounds):
+                connection.send((updates, count, maxmove,
+                                 random.getrandbits(32)))
+
+            merged = QTable()
+            for connection in connections:
+                merged.merge(*connection.recv())
+            updates = merged.get_arrays()
+            agent.q.update(*updates)
+
+            completed += sum(rounds)
+            if verbose:
+                print('Completed {} games'.format(completed))
+    finally:
+        for connection in connections:
+            connection.send(None)
+        for worker in workers:
+            worker.join()
+
+    return agent
+
+
 if __name__ == "__main__":
     PARSER = argparse.ArgumentParser(description='Train an agent using RL')
     PARSER.add_argument('--name', '-n',
@@ -81,30 +191,57 @@ if __name__ == "__main__":
     PARSER.add_argument('--verbose', '-v',
                         help='Toggle verbosity',
                         default=1)
+    PARSER.add_argument('--processes', '-p',
+                        help='Number of processes to train in.',
+                        default=1)
+    PARSER.add_argument('--sync', '-s',
+                        help='Number of games each process plays between merges of the Q-tables.',
+                        default=1000)
+    PARSER.add_argument('--memory', '-b',
+                        help='Memory budget of the Q-table in megabytes; the least visited entries are evicted to stay within it.',
+                        default=0)
+    PARSER.add_argument('--seed', '-r',
+                        help='Seed of the games, to train the same agent again.',
+                        default='None')
     PARSER.add_argument('--continued', '-c',
                         help='If the agent is saved, load it and continue training',
                         default=0)
 
     ARGS = PARSER.parse_args()
 
+    seed = None if ARGS.seed == 'None' else int(ARGS.seed)
+
     if bool(int(ARGS.continued)):
-        infilename = ARGS.name
-        with open(infilename, 'rb') as f:
-            agent = pickle.load(f)
+        agent = load_agent(ARGS.name, mmap=False)
     else:
         agent = SarsaAgent()
+    if float(ARGS.memory) > 0:
+        agent.q.set_max_bytes(int(float(ARGS.memory) * 2**20))
+
+    if int(ARGS.processes) > 1:
+        random.seed(seed)
+        agent = train_parallel(agent, int(ARGS.processes), int(ARGS.games),
+                               int(ARGS.sync), int(ARGS.maxmove),
+                               int(ARGS.verbose))
+    else:
+        agent = train_games(agent, int(ARGS.games), int(ARGS.maxmove), seed,
+                            int(ARGS.verbose))
 
-    for i in range(int(ARGS.games)):
-        if int(ARGS.verbose):
-            print('Completed {} games'.format(i))
-        try:
-            agent = train(agent, RandomSarsaAgent('opponent'), maxmove=int(ARGS.maxmove))
-        except:
-            pass
-
+    # A continued agent is saved in the format it was loaded from.
+    save_table = ARGS.name.endswith('.qtable')
     if bool(int(ARGS.continued)):
-        outfilename = '{}-updated.pkl'.format(ARGS.name)
+        save_table = is_table_file(ARGS.name)
+        extension = '.qtable' if save_table else '.pkl'
+        outfilename = '{}-updated{}'.format(ARGS.name, extension)
     else:
         outfilename = ARGS.name
-    with open(outfilename, 'wb') as f:
-        pickle.dump(agent, f)
+    if int(ARGS.verbose) and agent.q.get_max_bytes() is not None:
+        evicted, evicted_bytes = agent.q.get_evictions()
+        print('Kept {} entries in {} bytes, evicted {} entries ({} bytes)'.format(
+            len(agent.q), agent.q.get_nbytes(), evicted, evicted_bytes))
+
+    if save_table:
+        agent.save(outfilename)
+    else:
+        with open(outfilename, 'wb') as f:
+            pickle.dump(agent, f)
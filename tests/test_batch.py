@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    Tests of the NumPy batch engine, against the scalar engine of Game and
+    Board on the same positions.
+"""
+
+import random
+
+from gym import spaces
+import numpy as np
+
+from amca.game import Game, Board, BatchGame, ALL_ACTIONS, DiceRoller, get_batch_actions
+from amca.game.batch import COLUMN_ACTIONS, get_legal_masks
+from amca.agents import RandomAgent
+
+
+def get_snapshots(games, seed=0):
+    """Returns the snapshots of the positions of random games, of both
+    sides, with every number of dice left."""
+
+    rng = random.Random(seed)
+    snapshots = []
+    for index in range(games):
+        game = Game('amca', RandomAgent(spaces.Discrete(len(ALL_ACTIONS))),
+                    DiceRoller(seed + index))
+        for _ in range(400):
+            if game.get_done():
+                break
+            if not game.get_dice():
+                dice = [rng.randint(1, 6), rng.randint(1, 6)]
+                game.set_dice(dice*2 if dice[0] == dice[1] else dice)
+            snapshots.append(game.get_snapshot())
+            valid_actions, _ = game.get_valid_actions()
+            choices = [(action, roll) for actions, roll in zip(valid_actions, game.get_dice())
+                       for action in actions]
+            if choices:
+                game.make_move(*rng.choice(choices))
+            else:
+                game.make_move(None)
+
+    return snapshots
+
+
+def get_batch(snapshots, turn):
+    """Returns the boards and the dice, padded to 4, of the snapshots of a
+    side."""
+
+    boards = []
+    dice = []
+    for (board, rolls, side) in snapshots:
+        if side == turn:
+            boards.append(np.frombuffer(board[0], dtype=np.int8))
+            dice.append(list(rolls) + [0, ]*(4 - len(rolls)))
+
+    return np.array(boards), np.array(dice)
+
+
+def test_batch_actions_match_scalar_engine():
+    snapshots = get_snapshots(8)
+    game = Game('amca', RandomAgent(spaces.Discrete(len(ALL_ACTIONS))))
+    for turn, color in [(1, 'w'), (2, 'b')]:
+        side = [snapshot for snapshot in snapshots if snapshot[2] == turn]
+        boards, dice = get_batch(side, turn)
+        masks, positions, actionints, rolls, afterstates = get_batch_actions(
+            boards, dice, color)
+
+        for row, snapshot in enumerate(side):
+            game.set_snapshot(snapshot)
+            np.testing.assert_array_equal(masks[row], game.get_action_mask())
+
+        board = Board()
+        for position, actionint, roll, afterstate in zip(
+                positions, actionints, rolls, afterstates):
+            board.set_snapshot(side[position][0])
+            action = ALL_ACTIONS[actionint]
+            assert roll in side[position][1]
+            assert action in board.get_actions(color, int(roll))[0]
+            board.make(color, action)
+            np.testing.assert_array_equal(afterstate, board.get_array())
+
+
+def test_batch_game_masks_match_batch_actions():
+    game = BatchGame(64, seed=0)
+    rng = np.random.RandomState(0)
+    for _ in range(100):
+        masks = game.get_action_masks()
+        expected, _, _, _, _ = get_batch_actions(game.get_boards(), game.get_dice())
+        np.testing.assert_array_equal(masks, expected)
+
+        scores = rng.rand(*masks.shape)
+        scores[~masks] = -1
+        _, dones = game.step(scores.argmax(axis=1))
+        boards = game.get_boards().astype(np.int64)
+        assert (np.maximum(boards[:, :24], 0).sum(axis=1) + boards[:, 24] + boards[:, 26] == 15).all()
+        assert (np.maximum(-boards[:, :24], 0).sum(axis=1) - boards[:, 25] - boards[:, 27] == 15).all()
+        if dones.any():
+            game.reset(dones)
+
+
+def get_random_distribution(valid_actions):
+    """Returns the probabilities of the actions Game.get_random_action picks
+    among the valid actions of each dice."""
+
+    lists = [actions for actions in valid_actions if len(actions)]
+    probabilities = {}
+    for actions in lists:
+        for action in actions:
+            probabilities[action] = (probabilities.get(action, 0.0) +
+                                     1.0 / len(lists) / len(actions))
+
+    return probabilities
+
+
+def get_frequencies(columns):
+    """Returns the frequencies of the actions of some action columns."""
+
+    frequencies = {}
+    for column, count in zip(*np.unique(columns, return_counts=True)):
+        frequencies[ALL_ACTIONS[COLUMN_ACTIONS[column]]] = count / len(columns)
+
+    return frequencies
+
+
+def test_batch_opponent_matches_random_agent():
+    game = Game('amca', RandomAgent(spaces.Discrete(len(ALL_ACTIONS))))
+    batch = BatchGame(1, seed=0)
+    side = [snapshot for snapshot in get_snapshots(2) if snapshot[2] == 2]
+    tested = 0
+    for snapshot in side[::10]:
+        game.set_snapshot(snapshot)
+        valid_actions, _ = game.get_valid_actions()
+        if sum(1 for actions in valid_actions if len(actions)) < 2:
+            continue
+        tested += 1
+        if tested > 6:
+            break
+
+        # A RandomAgent picks any of ALL_ACTIONS, and an invalid one is
+        # replaced by Game.get_random_action.
+        replaced = get_random_distribution(valid_actions)
+        hits = {action: ALL_ACTIONS.count(action) / len(ALL_ACTIONS)
+                for action in replaced}
+        invalid = 1.0 - sum(hits.values())
+        expected = {action: hits[action] + invalid * probability
+                    for action, probability in replaced.items()}
+
+        boards, dice = get_batch([snapshot], 2)
+        legal = np.repeat(get_legal_masks(boards, 'b', dice), 20000, axis=0)
+        for columns, probabilities in [(batch.random_columns(legal), replaced),
+                                       (batch.opponent_columns(legal), expected)]:
+            frequencies = get_frequencies(columns)
+            assert set(frequencies) == set(probabilities)
+            for action, probability in probabilities.items():
+                assert abs(frequencies[action] - probability) < 0.015
+    assert tested > 6
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    Tests of the board, against a brute-force move generator written from the
+    rules on a plain list of the 28 signed slots.
+"""
+
+import pickle
+import random
+
+import pytest
+
+from amca.game.board import Board, W_BAR, B_BAR, W_OFF, B_OFF
+
+SIGNS = {'w': 1, 'b': -1}
+BARS = {'w': W_BAR, 'b': B_BAR}
+OFFS = {'w': W_OFF, 'b': B_OFF}
+
+
+def brute_actions(points, color, roll):
+    """Returns the set of the single dice actions of a color, checking every
+    slot by the rules."""
+
+    sign = SIGNS[color]
+    if points[BARS[color]] * sign > 0:
+        target = 24 - roll if color == 'w' else roll - 1
+        if points[target] * sign >= 0:
+            return {('reenter', target)}
+        if points[target] * sign == -1:
+            return {('reenter_hit', target)}
+        return set()
+
+    home = range(6) if color == 'w' else range(18, 24)
+    can_bearoff = all(points[index] * sign <= 0
+                      for index in range(24) if index not in home)
+    actions = set()
+    for source in range(24):
+        if points[source] * sign <= 0:
+            continue
+        target = source - roll if color == 'w' else source + roll
+        if 0 <= target < 24:
+            if points[target] * sign >= 0:
+                actions.add(('move', source, target))
+            elif points[target] * sign == -1:
+                actions.add(('hit', source, target))
+        elif can_bearoff:
+            actions.add(('bearoff', source))
+
+    return actions
+
+
+def brute_make(points, color, action):
+    """Returns the slots after an action, as a new list."""
+
+    points = list(points)
+    sign = SIGNS[color]
+    opponent = 'b' if color == 'w' else 'w'
+    if action[0] in ['move', 'hit', 'bearoff']:
+        points[action[1]] -= sign
+    else:
+        points[BARS[color]] -= sign
+    if action[0] == 'bearoff':
+        points[OFFS[color]] += sign
+        return points
+    target = action[-1]
+    if action[0] in ['hit', 'reenter_hit']:
+        points[target] = 0
+        points[BARS[opponent]] -= sign
+    points[target] += sign
+
+    return points
+
+
+def get_state(board):
+    """Returns everything the board keeps, and checks that it is what the
+    board would compute again from its slots."""
+
+    fresh = pickle.loads(pickle.dumps(board))
+    assert fresh.get_snapshot() == board.get_snapshot()
+
+    return board.get_snapshot()
+
+
+def get_positions(count, seed):
+    """Returns boards of random games, played with the brute-force moves."""
+
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        board = Board()
+        color = 'w'
+        for _ in range(rng.randint(0, 150)):
+            if board.is_over():
+                break
+            actions = sorted(brute_actions(board.get_points(), color, rng.randint(1, 6)))
+            if actions:
+                board.make(color, rng.choice(actions))
+            color = 'b' if color == 'w' else 'w'
+        boards.append(board)
+
+    return boards
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_actions_and_make_unmake_match_brute_force(seed):
+    for board in get_positions(25, seed):
+        before = get_state(board)
+        depth = board.get_undo_depth()
+        for color in ['w', 'b']:
+            for roll in range(1, 7):
+                actions, rewards = board.get_actions(color, roll)
+                assert len(actions) == len(rewards) == len(set(actions))
+                assert set(actions) == brute_actions(board.get_points(), color, roll)
+                for action in actions:
+                    expected = brute_make(board.get_points(), color, action)
+                    board.make(color, action)
+                    assert list(board.get_points()) == expected
+                    get_state(board)
+                    assert board.unmake() == (color, action)
+                    assert get_state(board) == before
+                    assert board.get_undo_depth() == depth
+
+
+def test_unmake_takes_back_a_whole_game():
+    rng = random.Random(0)
+    board = Board()
+    states = []
+    color = 'w'
+    while not board.is_over():
+        actions, _ = board.get_actions(color, rng.randint(1, 6))
+        if actions:
+            states.append(get_state(board))
+            board.make(color, rng.choice(actions))
+        color = 'b' if color == 'w' else 'w'
+
+    while states:
+        board.unmake()
+        assert get_state(board) == states.pop()
+    assert board.get_snapshot() == Board().get_snapshot()
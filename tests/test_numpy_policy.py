@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    Tests of the NumPy policies, against the stable_baselines models they are
+    exported from when stable_baselines is installed.
+"""
+
+import numpy as np
+import pytest
+
+from amca.game import ALL_ACTIONS
+from amca.agents.numpy_policy import NumpyPolicy, export_policy
+from amca.envs.backgammon_envs import BackgammonRandomEnv, BackgammonRandomMaskedEnv
+
+
+def write_policy(path, masked, seed=0):
+    """Writes a random 54-64-64-actions policy as export_policy would."""
+
+    rng = np.random.RandomState(seed)
+    sizes = [54, 64, 64, len(ALL_ACTIONS)]
+    arrays = {}
+    for index, (rows, columns) in enumerate(zip(sizes[:-1], sizes[1:])):
+        arrays['w{}'.format(index)] = rng.randn(rows, columns).astype(np.float32)/8
+        arrays['b{}'.format(index)] = rng.randn(columns).astype(np.float32)/8
+    observation_size = 54 + (len(ALL_ACTIONS) if masked else 0)
+    np.savez(path, num_layers=3, activation='tanh', masked=masked,
+             observation_size=observation_size, **arrays)
+
+
+def get_observations(env, count=32, seed=0):
+    """Returns the observations and masks of random valid moves of an env."""
+
+    rng = np.random.RandomState(seed)
+    env.seed(seed)
+    observations = [env.reset().copy()]
+    masks = [env.get_action_mask()]
+    while len(observations) < count:
+        valid = np.flatnonzero(masks[-1])
+        action = int(rng.choice(valid)) if valid.size else 0
+        observation, _, done, _ = env.step(action)
+        if done:
+            observation = env.reset()
+        observations.append(observation.copy())
+        masks.append(env.get_action_mask())
+
+    return np.array(observations), np.array(masks)
+
+
+def test_masked_policy_matches_unmasked_logits(tmp_path):
+    write_policy(str(tmp_path / 'plain.npz'), masked=False)
+    write_policy(str(tmp_path / 'masked.npz'), masked=True)
+    plain = NumpyPolicy(str(tmp_path / 'plain.npz'))
+    masked = NumpyPolicy(str(tmp_path / 'masked.npz'))
+    observations, _ = get_observations(BackgammonRandomEnv())
+    _, masks = get_observations(BackgammonRandomMaskedEnv())
+
+    logits = masked.get_logits(np.concatenate([observations, masks], axis=1))
+    expected = plain.get_logits(observations) + (1.0 - masks) * -1e9
+    np.testing.assert_allclose(logits, expected, rtol=1e-5)
+
+    # Positions without valid actions leave every action as likely.
+    movable = masks.any(axis=1)
+    probabilities = masked.action_probability(
+        np.concatenate([observations, masks], axis=1))
+    assert np.all(probabilities[movable][~masks[movable]] == 0)
+    np.testing.assert_allclose(probabilities.sum(axis=1), 1, rtol=1e-5)
+    actions, _ = masked.predict(np.concatenate([observations, masks], axis=1))
+    assert masks[np.arange(len(actions)), actions][movable].all()
+
+
+@pytest.mark.parametrize('masked', [False, True])
+def test_export_matches_stable_baselines(tmp_path, masked):
+    pytest.importorskip('stable_baselines')
+    from stable_baselines import PPO2
+    from stable_baselines.common.policies import MlpPolicy
+    from stable_baselines.common.vec_env import DummyVecEnv
+    from amca.agents.masked_policy import MaskedMlpPolicy
+
+    env_class = BackgammonRandomMaskedEnv if masked else BackgammonRandomEnv
+    model = PPO2(MaskedMlpPolicy if masked else MlpPolicy,
+                 DummyVecEnv([env_class]), seed=0)
+    path = str(tmp_path / 'policy.npz')
+    export_policy(model, path)
+    policy = NumpyPolicy(path)
+
+    observations, masks = get_observations(env_class())
+    assert policy.observation_space.shape == model.observation_space.shape
+    np.testing.assert_allclose(policy.action_probability(observations),
+                               model.action_probability(observations),
+                               rtol=1e-4, atol=1e-6)
+    if masked:
+        movable = masks.any(axis=1)
+        probabilities = policy.action_probability(observations)[movable]
+        assert np.all(probabilities[~masks[movable]] == 0)
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    Tests of the Q-table of the SARSA agent, against a dict of the same pairs.
+"""
+
+import os
+import pickle
+import random
+import re
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from amca.game import ALL_ACTIONS
+from amca.agents import SarsaAgent
+from amca.agents.qtable import (QTable, get_key, is_table_file, read_table,
+                                 MAX_LOAD, EVICTION_FRACTION, SLOT_BYTES)
+from amca.agents.sarsa import load_agent
+
+ACTIONS = sorted(set(ALL_ACTIONS)) + [('Nomove', 0, 0)]
+
+
+def fill(table, count, seed=0):
+    """Stores random pairs into a table, some of them more than once, and
+    returns the dict of their last values and the dict of their visits."""
+
+    rng = random.Random(seed)
+    states = [rng.getrandbits(64) for _ in range(count // 4 + 1)]
+    values = {}
+    visits = {}
+    for _ in range(count):
+        pair = (rng.choice(states), rng.choice(ACTIONS))
+        value = float(np.float32(rng.uniform(-10, 10)))
+        table.set(*pair, value)
+        values[pair] = value
+        visits[pair] = visits.get(pair, 0) + 1
+
+    return values, visits
+
+
+def get_visits(table):
+    """Returns the visits of the pairs of a table by key."""
+
+    keys, _, visits = table.get_arrays()
+
+    return dict(zip(keys.tolist(), visits.tolist()))
+
+
+@pytest.mark.parametrize('mmap', [False, True])
+def test_save_load_round_trip(tmp_path, mmap):
+    agent = SarsaAgent(epsilon=0.1, alpha=0.3, gamma=0.8)
+    values, visits = fill(agent.q, 5000)
+    path = str(tmp_path / 'agent.qtable')
+    agent.save(path)
+
+    assert is_table_file(path)
+    loaded = load_agent(path, mmap=mmap)
+    assert (loaded.epsilon, loaded.alpha, loaded.gamma) == (0.1, 0.3, 0.8)
+    assert len(loaded.q) == len(values)
+    for pair, value in values.items():
+        assert loaded.q.get(*pair) == value
+    assert get_visits(loaded.q) == {get_key(*pair): count for pair, count in visits.items()}
+    for array, expected in zip(loaded.q.get_slots(), agent.q.get_slots()):
+        np.testing.assert_array_equal(array, expected)
+
+    if not mmap:
+        state = random.Random(1).getrandbits(64)
+        loaded.q.set(state, ACTIONS[0], 1.5)
+        assert loaded.q.get(state, ACTIONS[0]) == 1.5
+        assert len(loaded.q) == len(values) + 1
+
+
+def test_read_table_rejects_other_files(tmp_path):
+    path = tmp_path / 'agent.pkl'
+    path.write_bytes(b'not a table')
+    assert not is_table_file(str(path))
+    with pytest.raises(ValueError):
+        read_table(str(path))
+
+    table_path = str(tmp_path / 'agent.qtable')
+    agent = SarsaAgent()
+    fill(agent.q, 10)
+    agent.save(table_path)
+    data = bytearray(open(table_path, 'rb').read())
+    data[8] = 1
+    with open(table_path, 'wb') as outfile:
+        outfile.write(data)
+    with pytest.raises(ValueError):
+        read_table(table_path)
+
+
+def test_merge_round_trip():
+    table = QTable()
+    values, visits = fill(table, 2000)
+    merged = QTable()
+    merged.merge(*table.get_arrays())
+    assert len(merged) == len(table)
+    for pair, value in values.items():
+        assert merged.get(*pair) == value
+    assert get_visits(merged) == get_visits(table)
+
+    copy = pickle.loads(pickle.dumps(table))
+    for array, expected in zip(copy.get_slots(), table.get_slots()):
+        np.testing.assert_array_equal(array, expected)
+
+
+def test_merge_averages_workers_by_visits():
+    table = QTable()
+    values, visits = fill(table, 2000)
+    pairs = list(values)
+
+    # Each worker updates some of the pairs of the table and new ones, as
+    # the workers of sarsa_train.train_parallel do.
+    updates = QTable()
+    workers = []
+    for seed in range(3):
+        worker = pickle.loads(pickle.dumps(table))
+        worker.reset_visits()
+        rng = random.Random(seed)
+        worker_values = {}
+        worker_visits = {}
+        for _ in range(1000):
+            if rng.random() < 0.5:
+                pair = rng.choice(pairs)
+            else:
+                pair = (rng.getrandbits(8), rng.choice(ACTIONS))
+            value = float(np.float32(rng.uniform(-10, 10)))
+            worker.set(*pair, value)
+            worker_values[pair] = value
+            worker_visits[pair] = worker_visits.get(pair, 0) + 1
+        updates.merge(*worker.get_visited())
+        workers.append((worker_values, worker_visits))
+    table.update(*updates.get_arrays())
+
+    merged_visits = get_visits(table)
+    for pair in set(pairs).union(*[set(worker_values) for worker_values, _ in workers]):
+        total = sum(worker_visits.get(pair, 0) for _, worker_visits in workers)
+        if total:
+            expected = sum(worker_values[pair] * worker_visits[pair]
+                           for worker_values, worker_visits in workers
+                           if pair in worker_values) / total
+        else:
+            expected = values[pair]
+        assert table.get(*pair) == pytest.approx(expected, rel=1e-5, abs=1e-5)
+        assert merged_visits[get_key(*pair)] == visits.get(pair, 0) + total
+
+
+def check_budget(table, model, evicted):
+    """Checks that a table within its memory budget holds the pairs of a
+    model of the eviction and reports the pairs evicted from it."""
+
+    assert table.get_nbytes() <= table.get_max_bytes()
+    assert len(table) == len(model)
+    assert get_visits(table) == {get_key(*pair): visits
+                                 for pair, (visits, _) in model.items()}
+    assert table.get_evictions() == (evicted, evicted * SLOT_BYTES)
+
+
+def test_set_evicts_least_visited_then_oldest():
+    # 2000 bytes allow 64 slots, which hold 44 entries, and keep 33 of them
+    # after an eviction.
+    table = QTable(capacity=10**6, max_bytes=2000)
+    assert len(table.get_slots()[0]) == 64
+    limit = int(64 * MAX_LOAD)
+    kept = int(64 * MAX_LOAD * (1 - EVICTION_FRACTION))
+
+    rng = random.Random(0)
+    pairs = [(rng.getrandbits(64), rng.choice(ACTIONS)) for _ in range(200)]
+    model = {}
+    evicted = 0
+    for tick in range(1, 3001):
+        # Some pairs are visited much more often than others.
+        pair = pairs[min(int(rng.expovariate(1 / 30)), len(pairs) - 1)]
+        if pair not in model and len(model) == limit:
+            order = sorted(model, key=model.get)
+            for old in order[:limit - kept]:
+                del model[old]
+            evicted += limit - kept
+        visits, _ = model.get(pair, (0, 0))
+        model[pair] = (visits + 1, tick)
+        table.set(*pair, float(tick))
+        check_budget(table, model, evicted)
+    assert evicted > 0
+    for pair, (_, tick) in model.items():
+        assert table.get(*pair) == float(tick)
+
+
+def test_update_stays_within_budget():
+    table = QTable(max_bytes=2000)
+    rng = random.Random(0)
+    stored = 0
+    for _ in range(20):
+        keys = np.array(sorted({rng.getrandbits(64) | 1 for _ in range(30)}),
+                        dtype=np.uint64)
+        visits = np.array([rng.randint(1, 5) for _ in keys], dtype=np.uint32)
+        before = get_visits(table)
+        before.update(zip(keys.tolist(), visits.tolist()))
+        table.update(keys, np.zeros(len(keys), dtype=np.float32), visits)
+        stored += len(keys)
+
+        assert table.get_nbytes() <= 2000
+        assert table.get_evictions() == (stored - len(table),
+                                         (stored - len(table)) * SLOT_BYTES)
+        kept = get_visits(table)
+        evicted = [before[key] for key in before if key not in kept]
+        # The new pairs are evicted along with the others, by their visits.
+        if evicted:
+            assert max(evicted) <= min(kept.values())
+    assert table.get_evictions()[0] > 0
+
+
+def test_set_max_bytes_shrinks_full_table():
+    table = QTable()
+    rng = random.Random(0)
+    pairs = [(rng.getrandbits(64), rng.choice(ACTIONS)) for _ in range(3000)]
+    model = {}
+    for tick, pair in enumerate(pairs + rng.choices(pairs, k=3000), 1):
+        visits, _ = model.get(pair, (0, 0))
+        model[pair] = (visits + 1, tick)
+        table.set(*pair, 0.0)
+    assert table.get_nbytes() > 2000
+
+    table.set_max_bytes(2000)
+    kept = int(64 * MAX_LOAD * (1 - EVICTION_FRACTION))
+    order = sorted(model, key=model.get)
+    evicted = len(model) - kept
+    check_budget(table, {pair: model[pair] for pair in order[evicted:]},
+                 evicted)
+
+    table.set_max_bytes(None)
+    fill(table, 1000)
+    assert table.get_evictions()[0] == evicted
+
+
+def test_sarsa_train_reports_evictions(tmp_path):
+    path = str(tmp_path / 'agent.qtable')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # A budget of 0.001 megabytes holds 22 entries.
+    output = subprocess.run(
+        [sys.executable, os.path.join(root, 'sarsa_train.py'), '-n', path,
+         '-g', '20', '-b', '0.001', '-r', '0'],
+        cwd=root, check=True, stdout=subprocess.PIPE,
+        universal_newlines=True).stdout
+    match = re.search(r'Kept (\d+) entries in (\d+) bytes, evicted (\d+) '
+                      r'entries \((\d+) bytes\)', output)
+    assert match
+    count, nbytes, evicted, evicted_bytes = map(int, match.groups())
+    assert nbytes <= 0.001 * 2**20
+    assert evicted > 0 and evicted_bytes == evicted * SLOT_BYTES
+    assert count == len(load_agent(path).q)
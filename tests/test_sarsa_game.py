@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    Tests of the state keys of SarsaGame and of the migration of the Q-tables
+    keyed by state strings.
+"""
+
+import pickle
+import random
+
+from amca.game import Board, SarsaGame, DiceRoller
+from amca.game.board import W_BAR, B_BAR, W_OFF, B_OFF
+from amca.game.sarsa_game import encode_state, decode_state, get_state3_key
+from amca.agents import SarsaAgent, RandomSarsaAgent
+from amca.agents.qtable import get_state_digest
+
+
+def get_positions(games, seed=0):
+    """Yields the game, its board and a dice roll of the positions of random
+    games."""
+
+    rng = random.Random(seed)
+    white = RandomSarsaAgent('white')
+    black = RandomSarsaAgent('black')
+    game = SarsaGame(white, black, DiceRoller(seed))
+    board = Board()
+    for _ in range(games):
+        game.reset()
+        for _ in range(200):
+            if game.is_over():
+                break
+            game.roll_dice()
+            for player in [white, black]:
+                for i in range(2):
+                    if game.is_over():
+                        break
+                    board.set_snapshot(game.get_snapshot()[0])
+                    yield game, board, game.get_dice(i)
+                    actions, _ = game.get_actions(player, game.get_dice(i))
+                    if actions:
+                        game.update_board(player, rng.choice(actions))
+
+
+def is_split_kept(points):
+    """Returns if the missing checkers of a position are split between the
+    bars and the bourne off ones as get_state3_key assumes."""
+
+    white_home = all(value <= 0 for value in points[6:24])
+    black_home = all(value >= 0 for value in points[:18])
+
+    return ((points[W_BAR] if white_home else points[W_OFF]) == 0 and
+            (points[B_BAR] if black_home else points[B_OFF]) == 0)
+
+
+def test_state_keys_decode_to_their_positions():
+    digests = {}
+    for game, board, roll in get_positions(5):
+        assert decode_state(game.get_state_key(roll)) == (roll, board.get_points())
+        for color in ['w', 'b']:
+            points = board.get_canonical_points(color)
+            key = game.get_canonical_state_key(color, roll)
+            assert key == encode_state(points, roll) == encode_state(list(points), roll)
+            assert decode_state(key) == (roll, points)
+            # Distinct keys keep distinct digests in the Q-table.
+            assert digests.setdefault(get_state_digest(key), key) == key
+    assert game.get_canonical_state_key('w', 6) == game.get_state_key(6)
+
+
+def test_state3_key_is_one_canonical_key():
+    kept = 0
+    for game, board, roll in get_positions(5):
+        for color in ['w', 'b']:
+            key = get_state3_key(game.get_canonical_state(color, roll))
+            if is_split_kept(board.get_canonical_points(color)):
+                assert key == game.get_canonical_state_key(color, roll)
+                kept += 1
+    assert kept > 1000
+
+
+def test_migrate_pickled_dict_agent():
+    agent = SarsaAgent()
+    agent.q = {}
+    expected = {}
+    for index, (game, _, roll) in enumerate(get_positions(2)):
+        action = ('move', index % 24, 0)
+        state = game.get_canonical_state('w', roll)
+        agent.q[(state, action)] = float(index)
+        expected[(get_state3_key(state), action)] = float(index)
+    agent.q[('not a state', ('Nomove', 0, 0))] = 2.0
+
+    migrated = pickle.loads(pickle.dumps(agent))
+    assert len(migrated.q) == len(agent.q)
+    for (state, action), value in expected.items():
+        assert migrated.q.get(state, action) == value
+    assert migrated.q.get('not a state', ('Nomove', 0, 0)) == 2.0
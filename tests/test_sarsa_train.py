@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    Tests of the training of the SARSA agent in several processes.
+"""
+
+import random
+
+from amca.agents import SarsaAgent
+from amca.agents.qtable import QTable
+
+from sarsa_train import train_games, train_parallel
+
+
+def train_copies(agent, processes, games, sync, maxmove):
+    """Trains the agent as train_parallel does, but on a fresh copy of the
+    Q-table for every worker and round, in this process."""
+
+    completed = 0
+    while completed < games:
+        rounds = [max(0, min(sync, games - completed - i*sync))
+                  for i in range(processes)]
+        seeds = [random.getrandbits(32) for _ in rounds]
+        # train_games seeds the random module, which the workers do in their
+        # own processes.
+        state = random.getstate()
+        merged = QTable()
+        for count, seed in zip(rounds, seeds):
+            worker = SarsaAgent()
+            worker.q = agent.q.copy()
+            worker.q.reset_visits()
+            merged.merge(*train_games(worker, count, maxmove, seed).q.get_visited())
+        agent.q.update(*merged.get_arrays())
+        random.setstate(state)
+        completed += sum(rounds)
+
+    return agent
+
+
+def test_workers_keep_the_merged_table():
+    random.seed(0)
+    agent = train_parallel(SarsaAgent(), 2, 40, 5, 30, 0)
+    random.seed(0)
+    expected = train_copies(SarsaAgent(), 2, 40, 5, 30)
+
+    keys, values, visits = agent.q.get_arrays()
+    expected_keys, expected_values, expected_visits = expected.q.get_arrays()
+    assert len(keys) > 100
+    assert (dict(zip(keys.tolist(), zip(values.tolist(), visits.tolist()))) ==
+            dict(zip(expected_keys.tolist(),
+                     zip(expected_values.tolist(), expected_visits.tolist()))))
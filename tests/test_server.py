@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    Tests of the policy server, with clients sent to child processes the way
+    SubprocVecEnv sends its environments.
+"""
+
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from amca.game import ALL_ACTIONS
+from amca.agents.server import PolicyServer
+
+cloudpickle = pytest.importorskip('cloudpickle')
+
+
+class CloudpickleWrapper:
+    """Pickles its object with cloudpickle, as SubprocVecEnv does with the
+    functions making its environments."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __getstate__(self):
+        return cloudpickle.dumps(self.value)
+
+    def __setstate__(self, state):
+        self.value = cloudpickle.loads(state)
+
+
+def write_policy(path):
+    """Writes a random 54-64-actions policy as export_policy would."""
+
+    rng = np.random.RandomState(0)
+    np.savez(path, num_layers=2, activation='tanh', masked=False,
+             observation_size=54,
+             w0=rng.randn(54, 64).astype(np.float32),
+             b0=rng.randn(64).astype(np.float32),
+             w1=rng.randn(64, len(ALL_ACTIONS)).astype(np.float32),
+             b1=rng.randn(len(ALL_ACTIONS)).astype(np.float32))
+
+
+def ask(index, wrapper, masks, results):
+    """Asks the client of a wrapper for the action of each mask."""
+
+    client = wrapper.value
+    observation = np.zeros(54, dtype=np.float32)
+    results.put((index, [client.make_decision(observation, mask) for mask in masks]))
+
+
+@pytest.mark.parametrize('start_method', ['spawn', 'forkserver'])
+def test_clients_answer_in_child_processes(tmp_path, start_method):
+    if start_method not in multiprocessing.get_all_start_methods():
+        pytest.skip('{} is not available'.format(start_method))
+    path = str(tmp_path / 'policy.npz')
+    write_policy(path)
+
+    context = multiprocessing.get_context(start_method)
+    server = PolicyServer('ppo', path, 2, start_method=start_method)
+    clients = [CloudpickleWrapper(server.get_client(i)) for i in range(2)]
+    server.start()
+
+    rng = np.random.RandomState(0)
+    masks = [rng.rand(3, len(ALL_ACTIONS)) < 0.01 for _ in clients]
+    results = context.Queue()
+    workers = [context.Process(target=ask, args=(index, client, client_masks, results))
+               for index, (client, client_masks) in enumerate(zip(clients, masks))]
+    for worker in workers:
+        worker.start()
+    answers = dict(results.get(timeout=60) for _ in workers)
+    for worker in workers:
+        worker.join()
+    server.close()
+
+    assert all(worker.exitcode == 0 for worker in workers)
+    for index, client_masks in enumerate(masks):
+        assert len(answers[index]) == len(client_masks)
+        for mask, action in zip(client_masks, answers[index]):
+            assert mask[action]
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+    Amca: The RL-Based Backgammon Agent
+    https://github.com/ardabbour/amca/
+
+    Abdul Rahman Dabbour, Omid Khorsand Kazemy, Yusuf Izmirlioglu
+    Cognitive Robotics Laboratory
+    Faculty of Engineering and Natural Sciences
+    Sabanci University
+
+    Tests of the full-turn moves, against every sequence of single dice
+    actions for every order of the dice.
+"""
+
+from collections import Counter
+import itertools
+import random
+
+import pytest
+
+from amca.game import Board, get_turns
+
+
+def brute_afterstates(board, color, dice):
+    """Returns the set of the afterstates of the sequences that play the most
+    dice, and then the most pips."""
+
+    leaves = []
+
+    def play(rolls, played, pips):
+        actions = []
+        if rolls and not board.is_over():
+            actions, _ = board.get_actions(color, rolls[0])
+        if not actions:
+            leaves.append(((played, pips), board.get_points().tobytes()))
+            return
+        for action in actions:
+            board.make(color, action)
+            play(rolls[1:], played + 1, pips + rolls[0])
+            board.unmake()
+
+    for order in set(itertools.permutations(dice)):
+        play(order, 0, 0)
+    best = max(score for score, _ in leaves)
+
+    return {afterstate for score, afterstate in leaves if score == best}
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_turns_match_brute_force(seed):
+    rng = random.Random(seed)
+    for _ in range(4):
+        board = Board()
+        color = 'w'
+        while not board.is_over():
+            dice = [rng.randint(1, 6), rng.randint(1, 6)]
+            if dice[0] == dice[1]:
+                dice *= 2
+            before = board.get_snapshot()
+            turns = get_turns(board, color, dice)
+            assert board.get_snapshot() == before
+
+            afterstates = [afterstate for _, _, afterstate in turns]
+            assert len(afterstates) == len(set(afterstates))
+            assert set(afterstates) == brute_afterstates(board, color, dice)
+            for actions, rolls, afterstate in turns:
+                assert len(rolls) == len(actions)
+                assert not Counter(rolls) - Counter(dice)
+                for action in actions:
+                    board.make(color, action)
+                assert board.get_points().tobytes() == afterstate
+                for action in actions:
+                    board.unmake()
+
+            actions, _, _ = rng.choice(turns)
+            for action in actions:
+                board.make(color, action)
+            color = 'b' if color == 'w' else 'w'
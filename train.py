@@ -17,6 +17,7 @@
 # Standard imports
 import os
 import argparse
+import multiprocessing
 
 # Scientific Python imports
 import numpy as np
@@ -36,9 +37,13 @@ from stable_baselines.sac import policies as sac_policies
 
 # Amca imports
 import amca
+from amca.agents.masked_policy import MaskedMlpPolicy, MaskedDQNPolicy, MaskedDQN
+from amca.agents.registry import get_algorithm
+from amca.agents.server import PolicyServer
+from amca.envs.vec_env import BackgammonVecEnv
 
 
-def make_env(env_id, algorithm, rank, seed=0):
+def make_env(env_id, algorithm, rank, seed=0, opponent=None):
     """
     Utility function for multiprocessed env.
 
@@ -46,10 +51,14 @@ def make_env(env_id, algorithm, rank, seed=0):
     :param num_env: (int) the number of environment you wish to have in subprocesses
     :param seed: (int) the inital seed for RNG
     :param rank: (int) index of the subprocess
+    :param opponent: (object) the opponent agent, or None for the default one
     """
 
     def _init():
-        env = gym.make(env_id)
+        if opponent is None:
+            env = gym.make(env_id)
+        else:
+            env = gym.make(env_id, opponent=opponent)
         env.seed(seed + rank)
 
         os.makedirs(ARGS.log_directory, exist_ok=True)
@@ -110,6 +119,18 @@ if __name__ == "__main__":
                         help='RL Algorithm to use for training.',
                         default='DQN',
                         type=str)
+    PARSER.add_argument('--mask', '-k',
+                        help='Mask invalid actions out of the policy.',
+                        default=0,
+                        type=int)
+    PARSER.add_argument('--compact', '-u',
+                        help='Use uint8 observations instead of float32 ones.',
+                        default=0,
+                        type=int)
+    PARSER.add_argument('--td', '-f',
+                        help='Use the TD-Gammon encoding of the board as observation.',
+                        default=0,
+                        type=int)
     PARSER.add_argument('--timesteps', '-t',
                         help='Number of timesteps to train.',
                         default=100000,
@@ -118,6 +139,18 @@ if __name__ == "__main__":
                         help='How many multiprocesses to use.',
                         default=1,
                         type=int)
+    PARSER.add_argument('--vectorized', '-e',
+                        help='How many games to play at once in a single vectorized environment.',
+                        default=0,
+                        type=int)
+    PARSER.add_argument('--opponent', '-o',
+                        help='Path to a model to train against instead of a random opponent.',
+                        default='None',
+                        type=str)
+    PARSER.add_argument('--opponent_algorithm', '-r',
+                        help='Algorithm used to train the opponent model.',
+                        default='PPO',
+                        type=str)
     PARSER.add_argument('--graph', '-g',
                         help='Plot a performance graph of the training.',
                         default=1,
@@ -133,38 +166,22 @@ if __name__ == "__main__":
 
     ARGS = PARSER.parse_args()
 
-    if ARGS.algorithm.lower() == 'a2c':
-        algorithm = A2C
-    elif ARGS.algorithm.lower() == 'acer':
-        algorithm = ACER
-    elif ARGS.algorithm.lower() == 'acktr':
-        algorithm = ACKTR
-    elif ARGS.algorithm.lower() == 'ddpg':
-        algorithm = DDPG
+    algorithm = get_algorithm(ARGS.algorithm)
+    if algorithm is DDPG:
         MlpPolicy = ddpg_policies.MlpPolicy
         CnnPolicy = ddpg_policies.CnnPolicy
         LnMlpPolicy = ddpg_policies.LnMlpPolicy
         LnCnnPolicy = ddpg_policies.LnCnnPolicy
-    elif ARGS.algorithm.lower() == 'dqn':
-        algorithm = DQN
+    elif algorithm is DQN:
         MlpPolicy = dqn_policies.MlpPolicy
         CnnPolicy = dqn_policies.CnnPolicy
         LnMlpPolicy = dqn_policies.LnMlpPolicy
         LnCnnPolicy = dqn_policies.LnCnnPolicy
-    elif ARGS.algorithm.lower() == 'gail':
-        algorithm = GAIL
-    elif ARGS.algorithm.lower() == 'ppo':
-        algorithm = PPO2
-    elif ARGS.algorithm.lower() == 'sac':
-        algorithm = SAC
+    elif algorithm is SAC:
         MlpPolicy = sac_policies.MlpPolicy
         CnnPolicy = sac_policies.CnnPolicy
         LnMlpPolicy = sac_policies.LnMlpPolicy
         LnCnnPolicy = sac_policies.LnCnnPolicy
-    elif ARGS.algorithm.lower() == 'trpo':
-        algorithm = TRPO
-    else:
-        raise ValueError('Unidentified algorithm chosen')
 
     if ARGS.policy.lower() == 'mlp':
         policy = MlpPolicy
@@ -185,15 +202,68 @@ if __name__ == "__main__":
     else:
         raise ValueError('Unidentified policy chosen')
 
+    if ARGS.mask:
+        if algorithm is DQN:
+            algorithm = MaskedDQN
+            policy = MaskedDQNPolicy
+        elif algorithm in [A2C, ACKTR, PPO2, TRPO]:
+            policy = MaskedMlpPolicy
+        else:
+            raise ValueError('Masking is only supported for A2C, ACKTR, DQN, PPO and TRPO')
+
     if algorithm in [DDPG, GAIL, SAC]:
         env_id = 'BackgammonRandomContinuousEnv-v0'
+    elif ARGS.td and ARGS.compact:
+        raise ValueError('The TD-Gammon encoding can not be compact')
+    elif ARGS.td and ARGS.mask:
+        env_id = 'BackgammonRandomMaskedTDEnv-v0'
+    elif ARGS.td:
+        env_id = 'BackgammonRandomTDEnv-v0'
+    elif ARGS.mask and ARGS.compact:
+        env_id = 'BackgammonRandomMaskedCompactEnv-v0'
+    elif ARGS.mask:
+        env_id = 'BackgammonRandomMaskedEnv-v0'
+    elif ARGS.compact:
+        env_id = 'BackgammonRandomCompactEnv-v0'
     else:
         env_id = 'BackgammonRandomEnv-v0'
 
+    # The workers are started as SubprocVecEnv would by default, and the
+    # server and its queues come from the same context so that they can be
+    # sent to them.
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        start_method = 'forkserver'
+    else:
+        start_method = 'spawn'
+
+    # The opponent model is played by one server for all the environments,
+    # which batches the decisions of their opponents.
+    server = None
+    opponents = [None, ]*max(ARGS.multiprocess, 1)
+    if ARGS.opponent != 'None':
+        if ARGS.vectorized > 0:
+            raise ValueError('Vectorized environments play against a random opponent only')
+        server = PolicyServer(ARGS.opponent_algorithm, ARGS.opponent,
+                              len(opponents), start_method=start_method)
+        opponents = [server.get_client(i) for i in range(len(opponents))]
+        server.start()
+
     os.makedirs(ARGS.log_directory, exist_ok=True)
-    if ARGS.multiprocess > 1:
-        env = SubprocVecEnv([make_env(env_id, algorithm, i)
-                             for i in range(int(ARGS.multiprocess))])
+    if ARGS.vectorized > 0:
+        if algorithm in [DDPG, GAIL, SAC]:
+            raise ValueError('Vectorized environments have discrete actions only')
+        env = BackgammonVecEnv(ARGS.vectorized, masked=bool(ARGS.mask),
+                               compact=bool(ARGS.compact),
+                               td_gammon=bool(ARGS.td),
+                               log_directory=ARGS.log_directory)
+    elif ARGS.multiprocess > 1:
+        env = SubprocVecEnv([make_env(env_id, algorithm, i, opponent=opponents[i])
+                             for i in range(int(ARGS.multiprocess))],
+                            start_method=start_method)
+    elif server is not None:
+        env = gym.make(env_id, opponent=opponents[0])
+        env = Monitor(env, ARGS.log_directory, allow_early_resets=True)
+        env = DummyVecEnv([lambda: env])
     else:
         env = gym.make(env_id)
         env = Monitor(env, ARGS.log_directory, allow_early_resets=True)
@@ -207,6 +277,8 @@ if __name__ == "__main__":
 
     model.learn(total_timesteps=ARGS.timesteps)
     model.save('{}'.format(ARGS.name))
+    if server is not None:
+        server.close()
 
     if ARGS.graph:
         plot_results(ARGS.log_directory, ARGS.algorithm, ARGS.window)